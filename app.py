@@ -3,14 +3,157 @@ from reportlab.lib import colors as rl_colors
 from reportlab.lib.colors import HexColor 
 from reportlab.lib.pagesizes import landscape, letter
 from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image, Flowable
+from reportlab.pdfbase.pdfmetrics import stringWidth
 import numpy as np
 from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.enums import TA_LEFT
 from reportlab.lib.units import cm, mm 
-import matplotlib.pyplot as plt
+from matplotlib import colormaps
+from matplotlib.colors import to_rgb
+from matplotlib.figure import Figure
+from reportlab.graphics.shapes import Drawing, Group, String
+from reportlab.graphics.charts.linecharts import HorizontalLineChart
+from reportlab.graphics.charts.legends import LineLegend
+from reportlab.graphics.widgets.markers import makeMarker
 import streamlit as st # type: ignore
+import csv
 import io
+import os
+import functools
+import hashlib
+import importlib
+import json
+import multiprocessing
+import shutil
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import pyarrow.feather as feather
+
+# Numero maximo de libros de defectos parseados que se mantienen en memoria
+MAX_ARCHIVOS_CACHE = 8
+# Graficas rasterizadas que se conservan en memoria (cada PNG a 300 DPI pesa unos cientos de KB)
+MAX_GRAFICAS_CACHE = 48
+# Lectura por bloques de la exportacion de produccion de Tableau (CSV UTF-16 separado por tabs)
+OPCIONES_PRODUCCION = dict(encoding='utf-16', sep='\t', header=1)
+FILAS_POR_BLOQUE = 5000
+# Directorio para snapshots columnares y demas caches en disco
+CACHE_DIR = os.environ.get("DWR_CACHE_DIR", ".report_cache")
+# Subir si cambia el formato de los snapshots para invalidar los anteriores
+SNAPSHOT_VERSION = 5
+# Tamaño maximo de la cache en disco de PDFs terminados; se descartan los menos usados
+MAX_CACHE_PDF_MB = int(os.environ.get("DWR_PDF_CACHE_MB", "200"))
+# Reportes que se generan a la vez en segundo plano y terminados que se conservan para descargar
+MAX_TRABAJOS = int(os.environ.get("DWR_REPORT_WORKERS", "2"))
+MAX_REPORTES_TERMINADOS = 16
+# Almacenes de agregados por semana que se conservan por tipo (uno por archivo distinto)
+MAX_ALMACENES_AGREGADOS = 8
+# Graficas: "vector" (dibujos nativos de ReportLab) o "raster" (PNG de matplotlib a 300 DPI)
+MODO_GRAFICAS = os.environ.get("DWR_CHART_MODE", "vector")
+# Secciones del reporte en el orden del PDF (clave -> nombre en la interfaz); las cuatro
+# primeras comparten la pagina 'Summary'
+SECCIONES_REPORTE = {
+    'resumen': 'Summary: Count of Staged',
+    'garantia': 'Summary: Warranty Details',
+    'produccion': 'Summary: Production',
+    'ordenes': 'Summary: Weekly Orders',
+    'devoluciones': 'Returns per Week by Reason Code',
+    'semana_actual': 'Warranty Defects Of the Week',
+    'asm': 'Assembly Clubs and Orders Over Time',
+    'misbuilds': 'Misbuilds',
+}
+SECCIONES_RESUMEN = ['resumen', 'garantia', 'produccion', 'ordenes']
+# Entradas que necesita cada seccion ademas del libro de defectos; las que ninguna seccion
+# pedida usa no se leen ni se agregan
+DATOS_SECCIONES = {
+    'resumen': ['cubo'],
+    'garantia': ['cubo'],
+    'produccion': ['produccion'],
+    'ordenes': ['cubo', 'produccion'],
+    'devoluciones': ['cubo'],
+    'semana_actual': [],
+    'asm': ['produccion'],
+    'misbuilds': ['cubo', 'produccion'],
+}
+# Datos derivados que reciben los procesos que arman paginas, segun las entradas leidas
+DERIVADOS_PROCESOS = {
+    'defectos': ['df_semana_actual'],
+    'produccion': ['prod_semanal', 'df_weekly', 'df_weekly_hist', 'weekly_orders_totals'],
+    'cubo': ['cubo', 'week_cols'],
+}
+# Procesos para armar las paginas de un reporte en paralelo (0: todas en el mismo proceso)
+PROCESOS_SECCIONES = int(os.environ.get("DWR_SECTION_PROCESSES", "0"))
+# Alto de fila de las tablas de resumen
+ALTO_FILA = 12.5
+FECHA_INICIO = pd.to_datetime("2025-06-30")
+FECHA_INICIO_ANIO = pd.to_datetime("2024-12-30")
+
+# Catalogo de defectos: descripcion del reclamo -> Type
+CATALOGO_DEFECTOS = {
+    "New 60* Day Reshaft Policy - Customer Service":"FR30DAYRESHAFT",
+    "Customer Service" : "FRCUST",
+    "Damaged in Shipping":"FRDAMAGE",
+    "Apparel - Broken Component" : "FRDEFECT",
+    "Broken Hosel" : "FRDEFECT",
+    "Broken Shaft - grip" : "FRDEFECT",
+    "Broken Shaft - hosel" : "FRDEFECT",
+    "Club Head Rattle" : "FRDEFECT",
+    "Components Stripped (Adapter / Screw)" : "FRDEFECT",
+    "Face Caving In" : "FRDEFECT",
+    "Face Crack" : "FRDEFECT",
+    "Ferrule Repair" : "FRDEFECT",
+    "Popped Crown" : "FRDEFECT",
+    "Putter Weight Detached" : "FRDEFECT",
+    "Shaft Paint Chipping" : "FRDEFECT",
+    "Weight Port Failure" : "FRDEFECT",
+    "Crown Dent" : "FRDEFECT",
+    "Head paint / finish chipping" : "FRDEFECT",
+    "Poor Etching" : "FRDEFECT",
+    "Bag - Broken Component" : "FRDEFECT",
+    "Missing Paint Fill" : "FRDEFECT",
+    "Order Entry - Wrong Component" : "FRERROR",
+    "Order Entry - Wrong Dexterity" : "FRERROR",
+    "Order Entry - Length, Loft, Lie, etc." : "FRERROR",
+    "Misfit" : "FRERROR",
+    "Order Entry - Missing Item" : "FRERROR",
+    "Lost in shipping/Delivered to wrong address" : "FRLOSTSHIP",
+    "Blemishes / Cosmetic Damage" : "FRMISBUILD",
+    "Broken Component - Assembly" : "FRMISBUILD",
+    "Club Length - too long" : "FRMISBUILD",
+    "Club Length - too short" : "FRMISBUILD",
+    "Complete Head Shaft Separation" : "FRMISBUILD",
+    "Goop in Hosel" : "FRMISBUILD",
+    "Grip Alignment" : "FRMISBUILD",
+    "Loose Putter Hosel" : "FRDEFECT",
+    "Loose Shaft / Rattle" : "FRMISBUILD",
+    "Assembly - Wrong Component" : "FRMISBUILD",
+    "Misbuild - Loft, Lie, Swingweight" : "FRMISBUILD",
+    "Loose Weight" : "FRMISBUILD",
+    "Assembly - Wrong Order" : "FRWRONG",
+    "Apparel - Wrong Component" : "FRWRONG",
+    "Apparel - Wrong Order" : "FRWRONG",
+    "Swing Weights" : "REPAIR",
+    "-" : "RETURN",
+    "Paid reshaft": "SHAFTREPAIR",
+    "No defect found": "SHIPPING ONLY",
+    "M16 Shaft Connection" : "FRDEFECT",
+    "Toe Dent" : "FRDEFECT"
+
+}
+# Types del catalogo como categoria fija: el Type de cada reclamo se guarda como codigo entero
+TIPOS_DEFECTO = pd.CategoricalDtype(sorted(set(CATALOGO_DEFECTOS.values())))
+# Columnas de fecha del libro de defectos que pueden traer celdas escritas a mano
+COLUMNAS_FECHA_DEFECTOS = ["Original Sales Order Date"]
+# Columnas del libro de defectos que se guardan como categoricas (codigos enteros)
+CATEGORICAS_DEFECTOS = ["Staged", "Claim Type (Description)", "Shipper:", "Original Build Shop"]
+
+# Versiones que forman parte de la clave de la cache de PDFs: un cambio en el catalogo o en
+# el codigo del reporte invalida los PDFs guardados
+VERSION_CATALOGO = hashlib.sha256(json.dumps(CATALOGO_DEFECTOS, sort_keys=True).encode()).hexdigest()[:12]
+with open(__file__, 'rb') as _codigo:
+    VERSION_CODIGO = hashlib.sha256(_codigo.read()).hexdigest()[:12]
 
 def main():
     st.title("📊 Defect and Warranty Report System")
@@ -20,18 +163,11 @@ def main():
     production_file = st.file_uploader("Production by Date from Tableu (CSV)", type=["csv"])
     
     if defect_file and production_file:
-        # 2. Procesar archivos para obtener semanas disponibles
-        df_temp = pd.read_excel(defect_file, header=1)
-        fechainicio = pd.to_datetime("2025-06-30")
-        df_temp["semana_relativa"] = (((df_temp['Date:'] - fechainicio).dt.days // 7) + 1).astype("Int64")
-        df_temp = df_temp.dropna(subset=['semana_relativa'])
-        df_temp["semana_relativa"] = df_temp["semana_relativa"].astype(int)  # Forzar enteros
-        
-        # Crear columna de semana con formato consistente
-        df_temp["Historical Week"] = 'Week ' + df_temp["semana_relativa"].astype(str).str.replace(r'\.0$', '', regex=True)
+        # 2. Procesar archivos para obtener semanas disponibles (parseo cacheado por contenido)
+        df_temp = obtener_defectos(defect_file)
         
         # 3. Selector de semana con semanas reales disponibles
-        semanas_disponibles = sorted(df_temp['Historical Week'].unique())
+        semanas_disponibles = sorted(df_temp['semana_relativa'].unique().tolist())
         if not semanas_disponibles:
             st.error("No valid weeks were found in the file.")
             return
@@ -39,121 +175,1216 @@ def main():
         semana_seleccionada = st.selectbox(
             "Select a Week:",
             options=semanas_disponibles,
-            index=len(semanas_disponibles)-1
+            index=len(semanas_disponibles)-1,
+            format_func=etiqueta_semana
         )
          
-        # 4. Generar reporte
-        if st.button("Generate Report"):
-            with st.spinner(f"Generating Report for {semana_seleccionada}..."):
-                try:
-                    # Pasar el DataFrame temporal para mantener consistencia
-                    pdf_buffer = procesar_archivos(defect_file, production_file, semana_seleccionada)
-                    
-                    st.success("Report created successfully!")
+        secciones = st.multiselect(
+            "Sections:",
+            options=list(SECCIONES_REPORTE),
+            default=list(SECCIONES_REPORTE),
+            format_func=SECCIONES_REPORTE.get
+        )
+
+        mostrar_perfil = st.checkbox("Show performance profile")
+        medir_memoria = st.checkbox("Track peak memory per stage (slower)", disabled=not mostrar_perfil)
+
+        # 4. Generar reporte en segundo plano: la sesion no se bloquea, un rerun no pierde el
+        # trabajo y pedidos iguales (mismos archivos, semana y secciones) comparten el mismo reporte
+        if st.button("Generate Report", disabled=not secciones):
+            try:
+                clave = encolar_reporte(defect_file, production_file, semana_seleccionada, memoria=medir_memoria,
+                                        secciones=secciones)
+                reportes = st.session_state.setdefault('reportes', [])
+                if clave in reportes:
+                    reportes.remove(clave)
+                reportes.insert(0, clave)
+                # La etiqueta queda en la sesion por si la cola descarta el trabajo terminado
+                st.session_state.setdefault('etiquetas', {})[clave] = etiqueta_reporte(estado_reporte(clave))
+            except Exception as e:
+                st.error(f"Error generating the report: {str(e)}")
+
+        mostrar_reportes(mostrar_perfil)
+
+
+def reportes_pendientes():
+    trabajos = (estado_reporte(clave) for clave in st.session_state.get('reportes', []))
+    return any(trabajo is not None and trabajo['estado'] in ('en cola', 'generando') for trabajo in trabajos)
+
+
+def mostrar_reportes(mostrar_perfil):
+    # Solo se vuelve a dibujar cada segundo mientras haya trabajos pendientes
+    refrescar = reportes_pendientes()
+    st.fragment(dibujar_reportes, run_every=1 if refrescar else None)(mostrar_perfil, refrescar)
+
+
+def dibujar_reportes(mostrar_perfil, refrescar):
+    if refrescar and not reportes_pendientes():
+        # Ya terminaron todos: un rerun completo vuelve a armar el fragmento sin refresco
+        st.rerun()
+    for clave in st.session_state.get('reportes', []):
+        trabajo = estado_reporte(clave)
+        if trabajo is None:
+            st.warning(f"{st.session_state['etiquetas'][clave]}: The report is no longer cached, generate it again.")
+            continue
+        etiqueta = etiqueta_reporte(trabajo)
+        if trabajo['estado'] == 'error':
+            st.error(f"{etiqueta}: Error generating the report: {trabajo['error']}")
+        elif trabajo['estado'] != 'listo':
+            st.progress(trabajo['avance'], text=f"Generating Report for {etiqueta}... ({trabajo['etapa']})")
+        elif not os.path.exists(trabajo['ruta']):
+            st.warning(f"{etiqueta}: The report is no longer cached, generate it again.")
+        else:
+            st.success(f"Report for {etiqueta} created successfully!")
+            # La sesion solo guarda la ruta: el PDF se lee del disco recien al descargarlo
+            st.download_button(
+                label="⬇️ Download Report",
+                data=functools.partial(leer_reporte, trabajo['ruta']),
+                file_name=nombre_reporte(trabajo['semana']),
+                mime="application/pdf",
+                key=f"descargar_{clave}"
+            )
+            if mostrar_perfil and trabajo['perfil'] is not None:
+                resultado = trabajo['perfil']
+                with st.expander(f"Performance profile ({resultado['total_segundos']:.2f}s)"):
+                    st.dataframe(pd.DataFrame(resultado['etapas']), hide_index=True)
                     st.download_button(
-                        label="⬇️ Download Report",
-                        data=pdf_buffer,
-                        file_name=f"Defect & Warranty Report {semana_seleccionada.lower().replace(' ', '_')}.pdf",
-                        mime="application/pdf"
+                        label="Download profile (JSON)",
+                        data=perfil_json(resultado),
+                        file_name=nombre_reporte(trabajo['semana']).replace('.pdf', '.profile.json'),
+                        mime="application/json",
+                        key=f"perfil_{clave}"
                     )
-                except Exception as e:
-                    st.error(f"Error generating the report: {str(e)}")
- 
-
-def procesar_archivos(defectFile, productionFile, semana_seleccionada):
-    df= pd.read_excel(defectFile, header=1)
-    fechainicio = pd.to_datetime("2025-06-30")
-    fechainicio2 = pd.to_datetime("2024-12-30")
-    df["semana_relativa"] = (((df['Date:'] - fechainicio).dt.days // 7) + 1).astype("Int64")
-    df["Historical Week"] = 'Week ' + df["semana_relativa"].astype(str) 
-    df["semana_natural"] = (((df["Date:"] - fechainicio2).dt.days // 7) + 1).astype("Int64")
-    df["Year Week"] = 'Week ' + df["semana_natural"].astype(str)
+
+
+def etiqueta_reporte(trabajo):
+    etiqueta = etiqueta_semana(trabajo['semana'])
+    if trabajo['secciones'] != list(SECCIONES_REPORTE):
+        etiqueta += f" ({', '.join(SECCIONES_REPORTE[seccion] for seccion in trabajo['secciones'])})"
+    return etiqueta
+
+
+def etiqueta_semana(semana):
+    # Las semanas se manejan como enteros; la etiqueta solo se arma al renderizar
+    return f'Week {semana}'
+
+
+def etiquetas_semanas(semanas):
+    return [etiqueta_semana(semana) for semana in semanas]
+
+
+def numero_semana(semana):
+    # Acepta el entero o la etiqueta 'Week N'
+    if isinstance(semana, str):
+        return int(semana.replace('Week ', ''))
+    return int(semana)
+
+
+@functools.lru_cache(maxsize=8)
+def calendario(anio_desde, anio_hasta):
+    # Una fila por dia de los años pedidos: semana del reporte (desde FECHA_INICIO), semana
+    # del año (desde FECHA_INICIO_ANIO), semana ISO y primer y ultimo dia de la semana.
+    # Se arma una vez por rango de años; no se debe modificar
+    dias = pd.date_range(f"{anio_desde}-01-01", f"{anio_hasta}-12-31", freq='D')
+    semanas = (dias - FECHA_INICIO).days // 7 + 1
+    iso = dias.isocalendar()
+    inicio = FECHA_INICIO + pd.to_timedelta((semanas - 1) * 7, unit='D')
+    return pd.DataFrame({
+        'semana_relativa': semanas,
+        'semana_natural': (dias - FECHA_INICIO_ANIO).days // 7 + 1,
+        'anio_iso': iso['year'].to_numpy(),
+        'semana_iso': iso['week'].to_numpy(),
+        'inicio_semana': inicio,
+        'fin_semana': inicio + pd.Timedelta(days=6),
+    }, index=dias)
+
+
+@functools.lru_cache(maxsize=8)
+def calendario_semanas(anio_desde, anio_hasta):
+    # Primer y ultimo dia de cada semana del reporte en los años pedidos
+    dias = calendario(anio_desde, anio_hasta)
+    return dias.drop_duplicates('semana_relativa').set_index('semana_relativa')[['inicio_semana', 'fin_semana']]
+
+
+def anios_fechas(fechas):
+    validas = fechas.dropna()
+    if validas.empty:
+        return FECHA_INICIO.year, FECHA_INICIO.year
+    return int(validas.min().year), int(validas.max().year)
+
+
+def semanas_fechas(fechas):
+    # Semanas de cada fecha con un solo join contra el calendario (NaT da semanas nulas)
+    fechas = pd.Series(pd.to_datetime(fechas)).dt.normalize()
+    semanas = calendario(*anios_fechas(fechas)).reindex(fechas.to_numpy())
+    semanas.index = fechas.index
+    return semanas
+
+
+def asignar_semanas(df, columna):
+    semanas = semanas_fechas(df[columna])
+    df["semana_relativa"] = semanas['semana_relativa'].astype("Int64")
+    df["semana_natural"] = semanas['semana_natural'].astype("Int64")
+    return df
+
+
+def filtrar_semanas(df, desde, hasta, columna='semana_relativa'):
+    # Filas de las semanas desde..hasta. Si los datos vienen ordenados por fecha basta con
+    # una busqueda binaria; si no, una comparacion vectorizada de rango
+    semanas = df[columna]
+    if semanas.is_monotonic_increasing and not semanas.hasnans:
+        inicio, fin = semanas.searchsorted([desde, hasta + 1])
+        return df.iloc[inicio:fin]
+    return df[(semanas >= desde) & (semanas <= hasta)]
+
+
+def leer_contenido(archivo):
+    # Acepta archivos subidos en Streamlit, rutas o bytes
+    if isinstance(archivo, (bytes, bytearray)):
+        return bytes(archivo)
+    if isinstance(archivo, (str, os.PathLike)):
+        with open(archivo, 'rb') as f:
+            return f.read()
+    if hasattr(archivo, 'getvalue'):
+        return archivo.getvalue()
+    archivo.seek(0)
+    return archivo.read()
+
+
+def hash_contenido(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def clave_pdf(hash_defectos, hash_produccion, semana, modo_graficas=None, secciones=None):
+    partes = [hash_defectos, hash_produccion, str(numero_semana(semana)), modo_graficas or MODO_GRAFICAS,
+              ",".join(secciones_reporte(secciones)), VERSION_CATALOGO, VERSION_CODIGO]
+    return hashlib.sha256("_".join(partes).encode()).hexdigest()
+
+
+def ruta_pdf(clave):
+    return os.path.join(CACHE_DIR, "pdfs", f"{clave}.pdf")
+
+
+def leer_reporte(ruta):
+    # Se llama recien al hacer clic en descargar: el PDF pudo salir de la cache despues de
+    # dibujar el boton, y el rerun del clic ya muestra el aviso de volver a generarlo
+    try:
+        with open(ruta, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"The report is no longer cached: {os.path.basename(ruta)}") from None
+
+
+def copiar_pdf_cache(clave, destino):
+    # Copia un PDF de la cache a destino sin pasarlo entero por memoria
+    ruta = ruta_pdf(clave)
+    try:
+        shutil.copyfile(ruta, destino)
+        os.utime(ruta)
+        return True
+    except OSError:
+        return False
+
+
+def ruta_temporal(ruta):
+    # Unica por proceso e hilo: los trabajos de la cola corren en hilos del mismo proceso
+    return f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def guardar_pdf_cache(clave, pdf):
+    # pdf son los bytes del reporte o la ruta de un PDF ya escrito en disco
+    ruta = ruta_pdf(clave)
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = ruta_temporal(ruta)
+        if isinstance(pdf, (str, os.PathLike)):
+            shutil.copyfile(pdf, temporal)
+        else:
+            with open(temporal, 'wb') as f:
+                f.write(pdf)
+        os.replace(temporal, ruta)
+        descartar_pdfs(os.path.dirname(ruta), MAX_CACHE_PDF_MB * 2**20)
+    except OSError:
+        # Un PDF que no se pudo guardar no debe impedir entregar el reporte
+        pass
+
+
+def descartar_pdfs(directorio, limite, conservar=None):
+    # Borra los PDFs usados hace mas tiempo hasta que el total quede bajo el limite
+    entradas = []
+    for entrada in os.scandir(directorio):
+        if entrada.name.endswith('.pdf') and entrada.path != conservar:
+            info = entrada.stat()
+            entradas.append((info.st_mtime, info.st_size, entrada.path))
+    total = sum(tamanio for _, tamanio, _ in entradas)
+    for _, tamanio, ruta in sorted(entradas):
+        if total <= limite:
+            break
+        try:
+            os.remove(ruta)
+            total -= tamanio
+        except OSError:
+            pass
+
+
+def ruta_snapshot(tipo, clave):
+    return os.path.join(CACHE_DIR, "snapshots", f"{tipo}_v{SNAPSHOT_VERSION}_{clave}.feather")
+
+
+def leer_snapshot_ruta(ruta):
+    if not os.path.exists(ruta):
+        return None
+    try:
+        # Sin compresion para que el memory-map evite copias y decodificacion
+        return feather.read_table(ruta, memory_map=True).to_pandas()
+    except Exception:
+        return None
+
+
+def escribir_feather(df, ruta):
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = ruta_temporal(ruta)
+        feather.write_feather(df.reset_index(drop=True), temporal, compression='uncompressed')
+        os.replace(temporal, ruta)
+    except Exception:
+        # Un snapshot fallido no debe impedir generar el reporte
+        pass
+
+
+def leer_snapshot(tipo, clave):
+    return leer_snapshot_ruta(ruta_snapshot(tipo, clave))
+
+
+def guardar_snapshot(df, tipo, clave):
+    escribir_feather(df, ruta_snapshot(tipo, clave))
+
+
+def tipar_columnas(df, categoricas):
+    # Arrow no admite columnas object con tipos mezclados; se guardan como texto
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True).startswith('mixed'):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    for col in categoricas:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def tipos_defecto(descripciones):
+    # Type de cada reclamo: se busca en el catalogo solo una vez por descripcion distinta y
+    # se reparte por los codigos de la columna (las descripciones fuera del catalogo quedan nulas)
+    descripciones = descripciones.astype('category')
+    tipos = descripciones.cat.categories.map(lambda d: CATALOGO_DEFECTOS.get(d, np.nan))
+    codigos_tipo = np.append(TIPOS_DEFECTO.categories.get_indexer(tipos), -1)
+    return pd.Series(pd.Categorical.from_codes(codigos_tipo[descripciones.cat.codes.to_numpy()], dtype=TIPOS_DEFECTO),
+                     index=descripciones.index)
+
+
+def parsear_defectos(contenido):
+    df = asignar_semanas(pd.read_excel(io.BytesIO(contenido), header=1), 'Date:')
     first_nan_index = df[df[["Date:"]].isnull().any(axis=1)].index.min()
     if pd.isna(first_nan_index):
         # Si no hay NaN, usar todo el DataFrame
         df = df.copy()
     else:
         # Si hay NaN, cortar el DataFrame hasta ese índice
-        df = df.iloc[:first_nan_index, :]
-
-    semana_actual = semana_seleccionada
-
-    grh = 12.5
-
-    #Catalogo de defectos
-    defect_type = {
-        "New 60* Day Reshaft Policy - Customer Service":"FR30DAYRESHAFT",
-        "Customer Service" : "FRCUST",
-        "Damaged in Shipping":"FRDAMAGE",
-        "Apparel - Broken Component" : "FRDEFECT",
-        "Broken Hosel" : "FRDEFECT",
-        "Broken Shaft - grip" : "FRDEFECT",
-        "Broken Shaft - hosel" : "FRDEFECT",
-        "Club Head Rattle" : "FRDEFECT",
-        "Components Stripped (Adapter / Screw)" : "FRDEFECT",
-        "Face Caving In" : "FRDEFECT",
-        "Face Crack" : "FRDEFECT",
-        "Ferrule Repair" : "FRDEFECT",
-        "Popped Crown" : "FRDEFECT",
-        "Putter Weight Detached" : "FRDEFECT",
-        "Shaft Paint Chipping" : "FRDEFECT",
-        "Weight Port Failure" : "FRDEFECT",
-        "Crown Dent" : "FRDEFECT",
-        "Head paint / finish chipping" : "FRDEFECT",
-        "Poor Etching" : "FRDEFECT",
-        "Bag - Broken Component" : "FRDEFECT",
-        "Missing Paint Fill" : "FRDEFECT",
-        "Order Entry - Wrong Component" : "FRERROR",
-        "Order Entry - Wrong Dexterity" : "FRERROR",
-        "Order Entry - Length, Loft, Lie, etc." : "FRERROR",
-        "Misfit" : "FRERROR",
-        "Order Entry - Missing Item" : "FRERROR",
-        "Lost in shipping/Delivered to wrong address" : "FRLOSTSHIP",
-        "Blemishes / Cosmetic Damage" : "FRMISBUILD",
-        "Broken Component - Assembly" : "FRMISBUILD",
-        "Club Length - too long" : "FRMISBUILD",
-        "Club Length - too short" : "FRMISBUILD",
-        "Complete Head Shaft Separation" : "FRMISBUILD",
-        "Goop in Hosel" : "FRMISBUILD",
-        "Grip Alignment" : "FRMISBUILD",
-        "Loose Putter Hosel" : "FRDEFECT",
-        "Loose Shaft / Rattle" : "FRMISBUILD",
-        "Assembly - Wrong Component" : "FRMISBUILD",
-        "Misbuild - Loft, Lie, Swingweight" : "FRMISBUILD",
-        "Loose Weight" : "FRMISBUILD",
-        "Assembly - Wrong Order" : "FRWRONG",
-        "Apparel - Wrong Component" : "FRWRONG",
-        "Apparel - Wrong Order" : "FRWRONG",
-        "Swing Weights" : "REPAIR",
-        "-" : "RETURN",
-        "Paid reshaft": "SHAFTREPAIR",
-        "No defect found": "SHIPPING ONLY",
-        "M16 Shaft Connection" : "FRDEFECT",
-        "Toe Dent" : "FRDEFECT"
-
+        df = df.iloc[:first_nan_index, :].copy()
+    # Las fechas mezcladas con texto se convierten como lo hace el reporte (to_datetime con
+    # errors='coerce'); si no, tipar_columnas las guardaria como texto
+    for col in COLUMNAS_FECHA_DEFECTOS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    df = tipar_columnas(df, CATEGORICAS_DEFECTOS)
+    df["Type"] = tipos_defecto(df["Claim Type (Description)"])
+    return df
+
+
+# Formatos de Tableau sin año (ej: "Jul 1", "jul-01")
+FORMATOS_FECHA_SIN_ANIO = ['%b %d', '%b-%d']
+
+
+def parsear_fechas(fechas, referencia=None):
+    # Parsea la columna completa de una vez: el formato se detecta con la primera fecha
+    # y, si no trae año, se infiere del orden cronologico de las columnas (cada vez que el
+    # mes retrocede cambia el año) y la ultima fecha se ancla al año que la deja mas cerca
+    # de la referencia: la ultima fecha del libro de defectos cuando se conoce, hoy si no.
+    fechas = pd.Series(fechas, dtype=str).str.strip()
+    muestra = fechas.iloc[0]
+    for formato in FORMATOS_FECHA_SIN_ANIO:
+        # 2000 es bisiesto, asi "Feb 29" se puede leer antes de conocer el año real
+        try:
+            pd.to_datetime('2000 ' + muestra, format='%Y ' + formato)
+        except ValueError:
+            continue
+        sin_anio = pd.to_datetime('2000 ' + fechas, format='%Y ' + formato, errors='coerce')
+        if sin_anio.isna().any():
+            break
+        meses = sin_anio.dt.month.to_numpy()
+        dias = sin_anio.dt.day.to_numpy()
+        cambios_anio = np.concatenate([[0], np.cumsum(np.diff(meses) < 0)])
+        referencia = pd.Timestamp.today() if referencia is None else pd.Timestamp(referencia)
+        anio_final = min(
+            (referencia.year - 1, referencia.year, referencia.year + 1),
+            key=lambda anio: abs(pd.Timestamp(anio, meses[-1], min(dias[-1], 28)) - referencia),
+        )
+        anios = anio_final - (cambios_anio[-1] - cambios_anio)
+        partes = pd.DataFrame({'year': anios, 'month': meses, 'day': dias}, index=fechas.index)
+        return pd.to_datetime(partes, errors='coerce')
+    # Fechas con año explicito
+    try:
+        return pd.to_datetime(fechas, format='ISO8601')
+    except ValueError:
+        return pd.to_datetime(fechas, format='mixed', dayfirst=False)
+
+
+def encabezados_produccion(contenido):
+    # Fila de encabezados tal como viene en el archivo. pandas renombra los repetidos
+    # ("Jul 1" -> "Jul 1.1"), y se repiten cuando la exportacion cubre mas de un año
+    texto = io.TextIOWrapper(io.BytesIO(contenido), encoding=OPCIONES_PRODUCCION['encoding'], newline='')
+    lector = csv.reader(texto, delimiter=OPCIONES_PRODUCCION['sep'])
+    for _ in range(OPCIONES_PRODUCCION['header']):
+        next(lector)
+    return next(lector)
+
+
+def columnas_fecha_produccion(contenido):
+    # Encabezados de fecha de la exportacion de Tableau (solo lee la fila de encabezados):
+    # texto original de cada fecha indexado por el nombre de columna que le da pandas
+    columnas = pd.read_csv(io.BytesIO(contenido), nrows=0, **OPCIONES_PRODUCCION).columns
+    textos = pd.Series(encabezados_produccion(contenido)[:len(columnas)], index=columnas)
+    return textos[[col for col in columnas
+                   if 'Unnamed' not in str(col) and col not in ('SiteName', 'Local Operations Shift', 'Grand Total')]]
+
+
+def leer_produccion(contenido, fechas, filas_por_bloque=FILAS_POR_BLOQUE):
+    # Lee la exportacion por bloques: solo se materializan las columnas de fecha pedidas y,
+    # de cada bloque, las filas 'Grand Total' que no son 'Shipments'
+    bloques = pd.read_csv(io.BytesIO(contenido), usecols=['SiteName', 'Unnamed: 2', *fechas],
+                          dtype=str, chunksize=filas_por_bloque, **OPCIONES_PRODUCCION)
+    partes = [bloque[(bloque['SiteName'] == 'Grand Total') & (bloque['Unnamed: 2'] != 'Shipments')]
+              for bloque in bloques]
+    return pd.concat(partes, ignore_index=True)[['Unnamed: 2', *fechas]]
+
+
+def parsear_produccion(contenido, referencia=None):
+    # El año de cada fecha se infiere con todos los encabezados de la fila original
+    textos = columnas_fecha_produccion(contenido)
+    fechas = textos.index.tolist()
+    fechas_completas = pd.Series(parsear_fechas(textos.to_numpy(), referencia).to_numpy(), index=fechas)
+    dfprodfilter = leer_produccion(contenido, fechas)
+    #Transponer el DataFrame para que las métricas sean columnas
+    df_transposed = dfprodfilter.set_index('Unnamed: 2').T.reset_index()
+    df_transposed.columns = ['Fecha', 'Orders', 'ShippedQty']  # Renombrar columnas
+    df_transposed['Orders'] = df_transposed['Orders'].astype(int)
+    df_transposed['ShippedQty'] = (
+        df_transposed['ShippedQty']
+        .astype(str)  # Convertir todo a string primero
+        .str.replace('[.,]', '', regex=True)  # Eliminar puntos y comas
+        .replace('nan', np.nan)  # Mantener NaN como valores nulos
+        .astype('Int64')  # Tipo nullable integer de pandas
+    ) # Eliminar comas
+    #Agreagar semanas
+    df_transposed['Fecha'] = df_transposed['Fecha'].map(fechas_completas)
+    df_transposed = asignar_semanas(df_transposed, 'Fecha')
+    return df_transposed[['Fecha', 'semana_relativa', 'semana_natural', 'Orders', 'ShippedQty']]
+
+
+# Ingesta: cache en memoria por hash de contenido y, detras, un snapshot columnar en disco
+# que reutilizan los siguientes reportes (de cualquier semana) sin volver a parsear.
+# El contenido lleva "_" para que Streamlit no lo vuelva a hashear.
+@st.cache_data(max_entries=MAX_ARCHIVOS_CACHE, show_spinner=False)
+def cargar_defectos(clave, _contenido):
+    # El snapshot guarda el Type de cada reclamo, asi que depende tambien del catalogo
+    clave_snapshot = f"{clave}_{VERSION_CATALOGO}"
+    df = leer_snapshot("defectos", clave_snapshot)
+    if df is None:
+        df = parsear_defectos(_contenido)
+        guardar_snapshot(df, "defectos", clave_snapshot)
+    return df
+
+
+@st.cache_data(max_entries=MAX_ARCHIVOS_CACHE, show_spinner=False)
+def cargar_produccion(clave, _contenido, referencia=None):
+    # El año inferido de las fechas depende de la referencia, asi que forma parte de la clave.
+    # El snapshot guarda la exportacion completa y cada seccion toma de ahi sus semanas
+    clave_snapshot = clave if referencia is None else f"{clave}_{pd.Timestamp(referencia):%Y%m%d}"
+    df = leer_snapshot("produccion", clave_snapshot)
+    if df is None:
+        df = parsear_produccion(_contenido, referencia)
+        guardar_snapshot(df, "produccion", clave_snapshot)
+    return df
+
+
+def obtener_defectos(defectFile):
+    contenido = leer_contenido(defectFile)
+    return cargar_defectos(hash_contenido(contenido), contenido)
+
+
+def obtener_produccion(productionFile, referencia=None):
+    contenido = leer_contenido(productionFile)
+    return cargar_produccion(hash_contenido(contenido), contenido, referencia)
+
+
+def ruta_agregados(nombre, almacen):
+    return os.path.join(CACHE_DIR, "agregados", f"{nombre}_v{SNAPSHOT_VERSION}_{almacen}.feather")
+
+
+def elegir_almacen(nombre, huellas):
+    # Cada archivo tiene su propio almacen. Las exportaciones semanales de un mismo archivo
+    # repiten las semanas anteriores, asi que se usa el almacen que mas semanas comparte con
+    # el archivo; si ninguno comparte alguna se crea otro y se descartan los usados hace mas
+    # tiempo, para que archivos distintos usados alternadamente no se pisen
+    directorio = os.path.dirname(ruta_agregados(nombre, ''))
+    prefijo = f"{nombre}_v{SNAPSHOT_VERSION}_"
+    existentes = []
+    mejor, compartidas = None, 0
+    if os.path.isdir(directorio):
+        for entrada in os.scandir(directorio):
+            if not (entrada.name.startswith(prefijo) and entrada.name.endswith('.feather')):
+                continue
+            try:
+                existentes.append((entrada.stat().st_mtime, entrada.path))
+                guardado = feather.read_table(entrada.path, columns=['semana', 'huella'], memory_map=True).to_pandas()
+            except Exception:
+                continue
+            iguales = guardado.loc[guardado['semana'].map(huellas).eq(guardado['huella']), 'semana'].nunique()
+            if iguales > compartidas:
+                mejor, compartidas = entrada.path, iguales
+    if mejor is not None:
+        return mejor
+    for _, ruta in sorted(existentes)[:max(len(existentes) - MAX_ALMACENES_AGREGADOS + 1, 0)]:
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+    return ruta_agregados(nombre, hashlib.sha256(huellas.to_numpy().tobytes()).hexdigest()[:16])
+
+
+def huellas_semanales(df, columnas, columna_semana='semana_relativa'):
+    # Huella por semana que no depende del orden de las filas (suma de hashes por fila)
+    hashes = pd.util.hash_pandas_object(df[columnas], index=False).to_numpy()
+    semanas = df[columna_semana].to_numpy(dtype=np.int64, na_value=np.iinfo(np.int64).min)
+    return pd.Series(hashes).groupby(semanas).sum()
+
+
+def actualizar_agregados(nombre, df, columnas, agregar):
+    # Almacen persistente de agregados por semana (ver elegir_almacen). Se compara la huella
+    # de cada semana del archivo con la guardada y solo se recalculan las semanas nuevas o con cambios; las
+    # semanas que ya no vienen en el archivo se descartan.
+    huellas = huellas_semanales(df, columnas)
+    ruta = elegir_almacen(nombre, huellas)
+    guardado = leer_snapshot_ruta(ruta)
+    if guardado is None:
+        guardado = pd.DataFrame(columns=['semana', 'huella'])
+    vigentes = guardado[guardado['semana'].map(huellas).eq(guardado['huella'])]
+    pendientes = huellas.index.difference(pd.Index(vigentes['semana'].unique()))
+    if len(pendientes) == 0 and len(vigentes) == len(guardado):
+        # La fecha de modificacion marca el ultimo uso para el descarte
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+        return guardado
+    semanas = df['semana_relativa'].to_numpy(dtype=np.int64, na_value=np.iinfo(np.int64).min)
+    nuevos = agregar(df[np.isin(semanas, pendientes.to_numpy())])
+    nuevos.insert(1, 'huella', nuevos['semana'].map(huellas).astype(np.uint64))
+    partes = [parte for parte in (vigentes, nuevos) if len(parte)]
+    resultado = pd.concat(partes, ignore_index=True) if partes else nuevos
+    resultado = resultado.sort_values('semana', kind='stable').reset_index(drop=True)
+    escribir_feather(resultado, ruta)
+    return resultado
+
+
+def agregar_defectos(df):
+    conteos = df.groupby(['semana_relativa', 'Claim Type (Description)', 'Staged'], dropna=False, observed=True).size()
+    conteos = conteos.rename('conteo').reset_index()
+    conteos.columns = ['semana', 'descripcion', 'staged', 'conteo']
+    conteos['semana'] = conteos['semana'].astype(np.int64)
+    conteos['descripcion'] = conteos['descripcion'].astype(object)
+    conteos['staged'] = conteos['staged'].astype(object)
+    return conteos
+
+
+def agregar_produccion(df):
+    semanal = df.groupby('semana_relativa', as_index=False).agg({'Orders': 'sum', 'ShippedQty': 'sum'})
+    semanal.columns = ['semana', 'Total Orders', 'Total ShippedQty']
+    semanal['semana'] = semanal['semana'].astype(np.int64)
+    # Inicio y fin de cada semana desde el calendario, recortados a los dias que trae el
+    # archivo (la exportacion trae un dia por columna, sin huecos)
+    limites = calendario_semanas(*anios_fechas(df['Fecha'])).reindex(semanal['semana'])
+    semanal['Start Date'] = limites['inicio_semana'].clip(lower=df['Fecha'].min()).to_numpy()
+    semanal['End Date'] = limites['fin_semana'].clip(upper=df['Fecha'].max()).to_numpy()
+    return semanal
+
+
+def conteos_semanales(df):
+    return actualizar_agregados("defectos", df, ['semana_relativa', 'Claim Type (Description)', 'Staged'], agregar_defectos)
+
+
+def produccion_semanal(df_transposed):
+    semanal = actualizar_agregados("produccion", df_transposed, ['semana_relativa', 'Fecha', 'Orders', 'ShippedQty'], agregar_produccion)
+    return semanal.rename(columns={'semana': 'Week'})
+
+
+def codificar(serie):
+    # Codigos enteros ordenados; los nulos van en la ultima posicion
+    codigos, etiquetas = pd.factorize(serie, sort=True)
+    codigos = np.where(codigos < 0, len(etiquetas), codigos)
+    etiquetas = pd.Index(np.asarray(etiquetas, dtype=object)).append(pd.Index([np.nan], dtype=object))
+    return codigos, etiquetas
+
+
+def construir_cubo(conteos_semana, semana_fin, defect_type):
+    # Arma un cubo denso (descripcion x staged x semana) para las semanas 1..semana_fin a
+    # partir de los conteos por semana del almacen de agregados. El Type sale de la
+    # descripcion, asi que las tablas por Type, por Staged y por descripcion son
+    # reducciones de este mismo cubo.
+    en_rango = conteos_semana[(conteos_semana['semana'] >= 1) & (conteos_semana['semana'] <= semana_fin)]
+    desc_codigos, descripciones = codificar(en_rango['descripcion'])
+    staged_codigos, staged = codificar(en_rango['staged'])
+    semanas = en_rango['semana'].to_numpy(dtype=np.int64)
+    forma = (len(descripciones), len(staged), semana_fin)
+    plano = np.ravel_multi_index((desc_codigos, staged_codigos, semanas - 1), forma)
+    conteos = np.bincount(plano, weights=en_rango['conteo'].to_numpy(), minlength=int(np.prod(forma)))
+    conteos = conteos.astype(np.int64).reshape(forma)
+    # Suma acumulada por semana (con un cero al inicio) para totales de cualquier ventana
+    acumulado = np.concatenate([np.zeros(forma[:2] + (1,), dtype=conteos.dtype), conteos.cumsum(axis=2)], axis=2)
+    return {
+        'conteos': conteos,
+        'acumulado': acumulado,
+        'descripciones': descripciones,
+        'staged': staged,
+        'tipos': descripciones.map(lambda d: defect_type.get(d, np.nan)),
+        'semana_fin': semana_fin,
     }
-    
-    df["Type"] = df["Claim Type (Description)"].map(defect_type)
 
-    df = df[["Date:", "Historical Week", "Year Week", "Shipper:", "Original Order or Serial #", "RMA", "RC", "Status? (0,1,2)","Shipping Carrier","Tracking Number",
-            "Staged", "Make / Model", "Claim Type (Description)", "Type", "Pod Number", "Original Build Shop","Original Sales Order Date", "Days" ]]
 
-    #Crear PDF
-    margen_izquierdo = 20 * mm
-    margen_derecho = 20 * mm
-    margen_superior = 10 * mm  # Más pequeño para títulos más arriba
-    margen_inferior = 20 * mm
-    pdf_buffer = io.BytesIO()
-    doc = SimpleDocTemplate(pdf_buffer, 
-                            pagesize = landscape(letter),
-                            leftMargin=margen_izquierdo,
-                            rightMargin=margen_derecho,
-                            topMargin=margen_superior,
-                            bottomMargin=margen_inferior)
-    story = []
-    story.append(PageBreak())
+def reducir_cubo(cubo, matriz, filas, staged=None, tipo=None):
+    # Reduce (descripcion x staged x semanas) a un DataFrame indexado por 'Staged', 'Type' o 'Description'
+    descripciones = cubo['descripciones']
+    tipos = cubo['tipos']
+    etiquetas_staged = cubo['staged']
+    if staged is not None:
+        matriz = matriz[:, etiquetas_staged == staged]
+        etiquetas_staged = etiquetas_staged[etiquetas_staged == staged]
+    if tipo is not None:
+        matriz = matriz[tipos == tipo]
+        descripciones = descripciones[tipos == tipo]
+        tipos = tipos[tipos == tipo]
+    if filas == 'Staged':
+        frame = pd.DataFrame(matriz.sum(axis=0), index=etiquetas_staged)
+    else:
+        frame = pd.DataFrame(matriz.sum(axis=1), index=descripciones if filas == 'Description' else tipos)
+    frame = frame[frame.index.notna()]
+    if filas == 'Type':
+        frame = frame.groupby(level=0).sum()
+    frame.index = frame.index.astype(object)
+    frame.index.name = filas
+    return frame
+
+
+def tabla_cubo(cubo, filas, desde, hasta, staged=None, tipo=None):
+    # Equivale a pd.crosstab(filas, semana) sobre las semanas desde..hasta, con las semanas
+    # como enteros: solo quedan las filas y semanas con algun reclamo
+    desde = max(desde, 1)
+    frame = reducir_cubo(cubo, cubo['conteos'][:, :, desde - 1:hasta], filas, staged, tipo)
+    frame.columns = pd.RangeIndex(desde, hasta + 1, name='semana_relativa')
+    return frame.loc[(frame != 0).any(axis=1), (frame != 0).any(axis=0)]
+
+
+def totales_cubo(cubo, filas, desde, hasta, staged=None, tipo=None):
+    # Total por fila de la ventana desde..hasta usando la suma acumulada
+    desde = max(desde, 1)
+    hasta = max(hasta, desde - 1)
+    ventana = cubo['acumulado'][:, :, hasta] - cubo['acumulado'][:, :, desde - 1]
+    return reducir_cubo(cubo, ventana[:, :, None], filas, staged, tipo)[0]
+
+
+def totales_ventana(cubo, indice, filas, desde, hasta, staged=None, tipo=None):
+    # Totales de la ventana alineados a las filas de una tabla, incluida la fila 'Total'
+    totales = totales_cubo(cubo, filas, desde, hasta, staged=staged, tipo=tipo)
+    totales.loc['Total'] = totales.sum()
+    return totales.reindex(indice, fill_value=0)
+
+
+def semanas_activas(cubo, filas, desde, hasta, staged=None, tipo=None):
+    # Semanas de la ventana con algun reclamo en la vista (las columnas que dejaria tabla_cubo).
+    # La suma acumulada de cada vista se arma la primera vez y queda guardada en el cubo
+    activas = cubo.setdefault('activas', {})
+    clave = (filas, staged, tipo)
+    if clave not in activas:
+        frame = reducir_cubo(cubo, cubo['conteos'], filas, staged, tipo)
+        activas[clave] = np.concatenate([[0], np.cumsum((frame.to_numpy() != 0).any(axis=0))])
+    desde = max(desde, 1)
+    hasta = max(hasta, desde - 1)
+    return int(activas[clave][hasta] - activas[clave][desde - 1])
+
+
+def estadisticas_ventana(cubo, indice, filas, desde, hasta, staged=None, tipo=None, semanas=None):
+    # AVG y TOTAL de la ventana desde..hasta y su diferencia (DELTA) contra la ventana anterior
+    # del mismo largo (ANTERIOR), alineados a las filas de una tabla. Todo sale de sumas
+    # acumuladas, asi una ventana de 13 o 52 semanas cuesta lo mismo que una de 4. El AVG
+    # divide por las semanas con reclamos de la vista, o por semanas si se indica
+    largo = hasta - desde + 1
+    total = totales_ventana(cubo, indice, filas, desde, hasta, staged, tipo)
+    anterior = totales_ventana(cubo, indice, filas, desde - largo, desde - 1, staged, tipo)
+    if semanas is None:
+        semanas = semanas_activas(cubo, filas, desde, hasta, staged, tipo)
+    promedio = (total / semanas).round(0).astype(int) if semanas else total * 0
+    return pd.DataFrame({'AVG': promedio, 'TOTAL': total, 'ANTERIOR': anterior, 'DELTA': total - anterior})
+
+
+def ratios_ordenes(cubo, tipo, ordenes):
+    # Une los conteos semanales de un Type con las ordenes de cada semana (Serie indexada por
+    # semana): proporcion sobre ordenes y su complemento, sin ordenes la proporcion es 0
+    desde, hasta = (int(ordenes.index.min()), int(ordenes.index.max())) if len(ordenes) else (1, 0)
+    conteos = tabla_cubo(cubo, 'Type', desde, hasta, tipo=tipo).sum().rename('conteo')
+    ratios = ordenes.rename('ordenes').to_frame().join(conteos, how='left')
+    ratios['conteo'] = ratios['conteo'].fillna(0).astype(int)
+    ratios['ratio'] = (ratios['conteo'] / ratios['ordenes']).where(ratios['ordenes'] != 0, 0)
+    ratios['complemento'] = 1 - ratios['ratio']
+    return ratios
+
+
+def formatear_tabla(tabla, porcentaje=False):
+    # Formatea todo el frame de una vez: conteos como enteros, porcentajes con un decimal
+    if porcentaje:
+        texto = tabla.round(1).astype(str) + '%'
+        return texto.where(tabla.notna(), '0%')
+    return tabla.fillna(0).astype(int).astype(str)
+
+
+def datos_tabla(tabla, encabezado=None, columnas=None, titulo=None, porcentaje=False, total=None, indice=True):
+    # Lista de listas que espera Table: titulo, encabezados, filas formateadas y fila de totales
+    if columnas is None:
+        columnas = etiquetas_semanas(tabla.columns)
+    valores = formatear_tabla(tabla, porcentaje)
+    if total is not None:
+        valores.loc[total] = formatear_tabla(tabla.sum().to_frame().T, porcentaje).iloc[0].to_numpy()
+    filas = valores.to_numpy().tolist()
+    if indice:
+        filas = [[etiqueta] + fila for etiqueta, fila in zip(valores.index.tolist(), filas)]
+        columnas = [encabezado] + list(columnas)
+    data = [[titulo]] if titulo is not None else []
+    return data + [list(columnas)] + filas
+
+
+def medidas_tabla(encabezados, filas, estilo):
+    # Anchos de columna y altos de fila que calcularia Table para celdas de texto, pero
+    # midiendo una sola vez cada texto distinto por columna. El estilo debe ser igual en
+    # todas las filas del cuerpo (solo el encabezado cambia), como en las tablas de detalle
+    muestra = Table([encabezados] + filas[:1])
+    muestra.setStyle(estilo)
+    estilo_encabezado = muestra._cellStyles[0]
+    estilo_cuerpo = muestra._cellStyles[-1]
+    anchos = []
+    altos = np.zeros(len(filas))
+    for j, titulo in enumerate(encabezados):
+        s = estilo_encabezado[j]
+        ancho = max(stringWidth(linea, s.fontname, s.fontsize) for linea in str(titulo).split("\n")) + s.leftPadding + s.rightPadding
+        if filas:
+            s = estilo_cuerpo[j]
+            textos = ['' if fila[j] is None else str(fila[j]) for fila in filas]
+            distintos = set(textos)
+            ancho = max(ancho, max(max(stringWidth(linea, s.fontname, s.fontsize) for linea in texto.split("\n"))
+                                   for texto in distintos) + s.leftPadding + s.rightPadding)
+            lineas = np.fromiter((texto.count("\n") + 1 for texto in textos), dtype=float, count=len(textos))
+            altos = np.maximum(altos, (s.leading or 1.2 * s.fontsize) * lineas + s.topPadding + s.bottomPadding)
+        anchos.append(ancho)
+    alto_encabezado = max((s.leading or 1.2 * s.fontsize) * (str(titulo).count("\n") + 1) + s.topPadding + s.bottomPadding
+                          for titulo, s in zip(encabezados, estilo_encabezado))
+    return anchos, alto_encabezado, altos
+
+
+def estilo_sin_encabezado(estilo):
+    # Estilo de un bloque de continuacion sin encabezado, como el que arma Table al partirse
+    # sin repeatRows: se descartan los comandos que solo tocan el encabezado y el resto se
+    # corre una fila (el cuerpo tiene el mismo estilo en todas sus filas)
+    comandos = []
+    for comando in estilo.getCommands():
+        (sc, sr), (ec, er) = comando[1:3]
+        if isinstance(sr, str) or isinstance(er, str):
+            comandos.append(comando)
+            continue
+        if er == 0:
+            continue
+        if sr > 0:
+            sr -= 1
+        if er > 0:
+            er -= 1
+        comandos.append((comando[0], (sc, sr), (ec, er), *comando[3:]))
+    return TableStyle(comandos)
+
+
+class TablaDetalle(Flowable):
+    # Tabla de detalle que puede llegar a miles de filas (reclamos de la semana, misbuilds).
+    # Anchos y altos se calculan una sola vez (medidas_tabla) y, al partirse entre paginas,
+    # solo se arma como Table el bloque que cabe; el resto sigue como otra TablaDetalle que
+    # comparte los mismos datos. Asi el costo crece lineal con las filas, en vez de medir y
+    # volver a partir la tabla completa en cada pagina. Con repetir_encabezado los bloques
+    # siguientes repiten la fila de encabezados (como repeatRows=1); sin el, empiezan con la
+    # primera fila de datos y sin el formato del encabezado (ver estilo_sin_encabezado).
+    def __init__(self, encabezados, filas, estilo, repetir_encabezado=True, medidas=None, desde=0, hasta=None,
+                 con_encabezado=True):
+        Flowable.__init__(self)
+        self.hAlign = 'CENTER'
+        self.encabezados = encabezados
+        self.filas = filas
+        self.estilo = estilo
+        self.repetir_encabezado = repetir_encabezado
+        self.medidas = medidas_tabla(encabezados, filas, estilo) if medidas is None else medidas
+        self.desde = desde
+        self.hasta = len(filas) if hasta is None else hasta
+        self.con_encabezado = con_encabezado
+
+    def _altos(self, hasta=None):
+        _, alto_encabezado, altos = self.medidas
+        altos = altos[self.desde:self.hasta if hasta is None else hasta].tolist()
+        return ([alto_encabezado] if self.con_encabezado else []) + altos
+
+    def wrap(self, availWidth, availHeight):
+        self.width = sum(self.medidas[0])
+        self.height = sum(self._altos())
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        # Misma cuenta que Table: entran las filas cuya suma de altos no pasa del disponible.
+        # Solo se suman las filas que podrian entrar en la pagina, no todas las restantes
+        _, _, altos = self.medidas
+        minimo = altos[self.desde:self.hasta].min() if self.hasta > self.desde else 1
+        limite = min(self.hasta, self.desde + int(availHeight // minimo) + 1)
+        acumulado = np.cumsum(self._altos(limite))
+        entran = int(np.searchsorted(acumulado, availHeight, side='right'))
+        filas = entran - (1 if self.con_encabezado else 0)
+        if filas >= self.hasta - self.desde:
+            return [self]
+        if entran == 0 or (filas <= 0 and self.con_encabezado and self.repetir_encabezado):
+            return []
+        corte = self.desde + filas
+        return [self._parte(self.desde, corte, self.con_encabezado),
+                self._parte(corte, self.hasta, self.repetir_encabezado)]
+
+    def _parte(self, desde, hasta, con_encabezado):
+        return TablaDetalle(self.encabezados, self.filas, self.estilo, self.repetir_encabezado, self.medidas,
+                            desde, hasta, con_encabezado)
+
+    def tabla(self):
+        data = ([self.encabezados] if self.con_encabezado else []) + self.filas[self.desde:self.hasta]
+        tabla = Table(data, colWidths=self.medidas[0], rowHeights=self._altos())
+        tabla.setStyle(self.estilo if self.con_encabezado else estilo_sin_encabezado(self.estilo))
+        return tabla
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        # Se dibuja como la Table del bloque, en la misma posicion que tendria esa tabla
+        tabla = self.tabla()
+        tabla.wrapOn(canvas, self.width, self.height)
+        tabla.drawOn(canvas, x, y, _sW)
+
+
+def png_figura(fig, dpi=300):
+    # Cada reporte usa su propia Figure (sin el estado global de pyplot) y un buffer en
+    # memoria, asi dos reportes simultaneos no comparten archivos ni figuras
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi)
+    return buffer.getvalue()
+
+
+def huella_grafica(*partes):
+    # Hash de los datos y el estilo de una grafica; los arreglos se hashean por contenido
+    h = hashlib.sha256()
+
+    def agregar(valor):
+        if isinstance(valor, dict):
+            for llave in sorted(valor):
+                h.update(str(llave).encode())
+                agregar(valor[llave])
+        elif isinstance(valor, (list, tuple)):
+            h.update(b'[')
+            for elemento in valor:
+                agregar(elemento)
+            h.update(b']')
+        elif isinstance(valor, (np.ndarray, pd.Series, pd.Index)):
+            arreglo = np.asarray(valor)
+            h.update(str(arreglo.dtype).encode())
+            h.update(arreglo.tobytes() if arreglo.dtype != object else repr(arreglo.tolist()).encode())
+        else:
+            h.update(repr(valor).encode())
+        h.update(b'|')
+
+    for parte in partes:
+        agregar(parte)
+    return h.hexdigest()
+
+
+@st.cache_data(max_entries=MAX_GRAFICAS_CACHE, show_spinner=False)
+def png_grafica(clave, _categorias, _series, figsize, _opciones):
+    # PNG de la grafica memoizado por la huella de sus series y estilo: una grafica igual a
+    # una ya rasterizada (misma semana, o solo cambio otra seccion) no se vuelve a dibujar
+    return png_figura(figura_lineas(_categorias, _series, figsize, **_opciones))
+
+
+# Equivalencias de los estilos de matplotlib en los dibujos de ReportLab
+MARCADORES_VECTOR = {'o': 'FilledCircle', 's': 'FilledSquare', '^': 'FilledTriangle', 'D': 'FilledDiamond',
+                     'v': 'FilledTriangle', 'p': 'FilledPentagon', '*': 'FilledStarFive'}
+GUIONES_VECTOR = {'-': None, '--': [6, 3], '-.': [6, 2, 1, 2]}
+
+
+def figura_lineas(categorias, series, figsize, eje_derecho=(), titulos_ejes=(None, None), leyenda_titulo=None,
+                  leyenda_fuera=False, grid_alpha=None, etiquetas_valores=False):
+    # Grafica de lineas por semana con matplotlib; eje_derecho son series en un segundo eje Y
+    fig = Figure(figsize=figsize)
+    ax1 = fig.add_subplot()
+    if grid_alpha is not None:
+        ax1.grid(True, linestyle='--', alpha=grid_alpha)
+    ejes = [(ax1, series, titulos_ejes[0])]
+    if eje_derecho:
+        ejes.append((ax1.twinx(), eje_derecho, titulos_ejes[1]))
+    for ax, lista, titulo in ejes:
+        for serie in lista:
+            ax.plot(categorias, serie['valores'],
+                    label=serie['nombre'],
+                    color=serie['color'],
+                    marker=serie['marker'],
+                    linestyle=serie['linestyle'],
+                    linewidth=2,
+                    markersize=serie.get('markersize'))
+        if titulo:
+            ax.set_ylabel(titulo, color='black')
+    ax1.tick_params(axis='x', labelrotation=45)
+
+    # Combinar leyendas
+    lineas, etiquetas = [], []
+    for ax, _, _ in ejes:
+        lineas_eje, etiquetas_eje = ax.get_legend_handles_labels()
+        lineas += lineas_eje
+        etiquetas += etiquetas_eje
+    if leyenda_fuera:
+        ax1.legend(lineas, etiquetas, title=leyenda_titulo, bbox_to_anchor=(1.05, 1), loc='upper left',
+                   fontsize=11.5, borderpad=1.2, labelspacing=1.2)
+    else:
+        ax1.legend(lineas, etiquetas, title=leyenda_titulo, fontsize=10, loc='upper left')
+    fig.tight_layout()
+
+    # Etiquetas de valores
+    if etiquetas_valores:
+        for serie in series:
+            for categoria, val in zip(categorias, serie['valores']):
+                if val > 0:
+                    ax1.text(categoria, val + 0.5, str(val),
+                             ha='center', va='bottom',
+                             fontsize=9, color=serie['color'])
+    return fig
+
+
+def color_vector(color):
+    return rl_colors.Color(*to_rgb(color))
+
+
+def grafica_vector(x, y, width, height, categorias, series, mostrar_categorias=True):
+    grafica = HorizontalLineChart()
+    grafica.x, grafica.y, grafica.width, grafica.height = x, y, width, height
+    grafica.data = [[float(v) for v in serie['valores']] for serie in series]
+    grafica.joinedLines = 1
+    grafica.categoryAxis.categoryNames = [str(c) for c in categorias]
+    grafica.categoryAxis.labels.angle = 45
+    grafica.categoryAxis.labels.boxAnchor = 'ne'
+    grafica.categoryAxis.labels.fontName = 'Helvetica'
+    grafica.categoryAxis.visible = mostrar_categorias
+    grafica.valueAxis.labels.fontName = 'Helvetica'
+    grafica.valueAxis.rangeRound = 'both'
+    for i, serie in enumerate(series):
+        grafica.lines[i].strokeColor = color_vector(serie['color'])
+        grafica.lines[i].strokeWidth = 1.5
+        grafica.lines[i].strokeDashArray = GUIONES_VECTOR.get(serie['linestyle'])
+        marcador = makeMarker(MARCADORES_VECTOR.get(serie['marker'], 'FilledCircle'))
+        marcador.size = 6 if serie.get('markersize', 6) >= 8 else 4
+        marcador.fillColor = color_vector(serie['color'])
+        marcador.strokeColor = color_vector(serie['color'])
+        grafica.lines[i].symbol = marcador
+    return grafica
+
+
+def dibujo_lineas(categorias, series, width, height, eje_derecho=(), titulos_ejes=(None, None), leyenda_titulo=None,
+                  leyenda_fuera=False, grid_alpha=None, etiquetas_valores=False):
+    # Misma grafica que figura_lineas pero como dibujo vectorial nativo de ReportLab
+    dibujo = Drawing(width, height)
+    if not len(categorias) or not series:
+        return dibujo
+    # Igual que el PNG, el dibujo es mas ancho que el marco de la pagina: el contenido deja libre el borde derecho
+    margen_izq = 55 if titulos_ejes[0] else 40
+    margen_der = (70 if titulos_ejes[1] else 45) if eje_derecho else 10
+    ancho_leyenda = 150 if leyenda_fuera else 0
+    x, y = margen_izq, 45
+    ancho = width - 40 - margen_izq - margen_der - ancho_leyenda
+    alto = height - y - 10
+
+    grafica = grafica_vector(x, y, ancho, alto, categorias, series)
+    if grid_alpha is not None:
+        gris = rl_colors.Color(0.5, 0.5, 0.5, alpha=grid_alpha)
+        for eje in (grafica.valueAxis, grafica.categoryAxis):
+            eje.visibleGrid = 1
+            eje.gridStrokeColor = gris
+            eje.gridStrokeDashArray = [3, 2]
+    if etiquetas_valores:
+        grafica.lineLabelFormat = lambda v: str(int(v)) if v > 0 else ''
+        grafica.lineLabels.fontName = 'Helvetica'
+        grafica.lineLabels.fontSize = 6
+        for i, serie in enumerate(series):
+            for j in range(len(categorias)):
+                grafica.lineLabels[(i, j)].fillColor = color_vector(serie['color'])
+    dibujo.add(grafica)
+
+    if eje_derecho:
+        derecha = grafica_vector(x, y, ancho, alto, categorias, eje_derecho, mostrar_categorias=False)
+        derecha.valueAxis.joinAxis = derecha.categoryAxis
+        derecha.valueAxis.joinAxisMode = 'right'
+        derecha.valueAxis.labels.boxAnchor = 'w'
+        derecha.valueAxis.labels.dx = 5
+        dibujo.add(derecha)
+
+    # Titulos de los ejes Y
+    for titulo, posicion, giro in ((titulos_ejes[0], 12, 90), (titulos_ejes[1] if eje_derecho else None, x + ancho + margen_der - 10, -90)):
+        if titulo:
+            texto = Group(String(0, 0, titulo, fontName='Helvetica', fontSize=9, textAnchor='middle'))
+            texto.translate(posicion, y + alto / 2)
+            texto.rotate(giro)
+            dibujo.add(texto)
+
+    leyenda = LineLegend()
+    leyenda.fontName = 'Helvetica'
+    leyenda.fontSize = 8 if leyenda_fuera else 7
+    leyenda.alignment = 'right'
+    leyenda.columnMaximum = len(series) + len(eje_derecho)
+    leyenda.colorNamePairs = [(color_vector(serie['color']), str(serie['nombre'])) for serie in list(series) + list(eje_derecho)]
+    if leyenda_fuera:
+        leyenda.x, leyenda.y = x + ancho + margen_der + 10, y + alto - 12
+        if leyenda_titulo:
+            dibujo.add(String(leyenda.x, y + alto, leyenda_titulo, fontName='Helvetica-Bold', fontSize=9))
+    else:
+        leyenda.x, leyenda.y = x + 10, y + alto - 8
+    dibujo.add(leyenda)
+    return dibujo
+
+
+def grafica_lineas(categorias, series, width, height, figsize, modo=None, **opciones):
+    # Flowable de la grafica segun el modo: dibujo vectorial o PNG rasterizado (respaldo)
+    if (modo or MODO_GRAFICAS) == 'raster':
+        clave = huella_grafica(list(categorias), series, figsize, opciones)
+        png = png_grafica(clave, categorias, series, figsize, opciones)
+        return Image(io.BytesIO(png), width=width, height=height)
+    dibujo = dibujo_lineas(categorias, series, width, height, **opciones)
+    # Para volver a armarlo en otro proceso (ver preparar_envio)
+    dibujo._argumentos = (categorias, series, width, height, opciones)
+    return dibujo
+
+
+def nombre_reporte(semana):
+    return f"Defect & Warranty Report {etiqueta_semana(numero_semana(semana)).lower().replace(' ', '_')}.pdf"
+
+
+# Etapas que marca el reporte, en orden; sirven para estimar el avance de un trabajo
+ETAPAS_REPORTE = ['ingesta defectos', 'ingesta produccion', 'agregacion', 'tabla resumen', 'tabla garantia',
+                  'tabla produccion', 'tabla ordenes', 'grafica devoluciones', 'tablas devoluciones',
+                  'tabla semana actual', 'tabla ASM', 'grafica ASM', 'tablas misbuilds', 'grafica misbuilds',
+                  'layout PDF']
+
+
+def iniciar_perfil(memoria=False, avisar=None):
+    # Perfil de etapas del reporte: tiempo y, con memoria=True, pico de memoria entre marcas
+    # consecutivas. tracemalloc (lo asignado por Python y numpy) solo corre mientras se
+    # perfila y hace mas lentas las etapas con muchas asignaciones, por eso es opcional
+    propio = memoria and not tracemalloc.is_tracing()
+    if propio:
+        tracemalloc.start()
+    if memoria:
+        tracemalloc.reset_peak()
+    ahora = time.perf_counter()
+    return {'etapas': [], 'inicio': ahora, 'marca': ahora, 'memoria': memoria, 'avisar': avisar,
+            'asignado': tracemalloc.get_traced_memory()[0] if memoria else 0, 'propio': propio}
+
+
+def marcar_etapa(perfil, nombre):
+    # Cierra la etapa que empezo en la marca anterior; sin perfil no hace nada
+    if perfil is None:
+        return
+    ahora = time.perf_counter()
+    etapa = {'etapa': nombre, 'segundos': round(ahora - perfil['marca'], 4)}
+    if perfil['memoria']:
+        actual, pico = tracemalloc.get_traced_memory()
+        etapa['pico_mb'] = round(max(pico - perfil['asignado'], 0) / 2**20, 2)
+        tracemalloc.reset_peak()
+        perfil['asignado'] = actual
+    perfil['etapas'].append(etapa)
+    perfil['marca'] = ahora
+    if perfil['avisar'] is not None:
+        perfil['avisar'](nombre)
+
+
+def terminar_perfil(perfil):
+    if perfil['propio'] and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return {'total_segundos': round(time.perf_counter() - perfil['inicio'], 4), 'etapas': perfil['etapas']}
+
+
+def agregar_etapas(perfil, etapas):
+    # Etapas medidas en otro proceso; la siguiente marca cuenta desde que se recibieron
+    if perfil is None:
+        return
+    for etapa in etapas:
+        perfil['etapas'].append(etapa)
+        if perfil['avisar'] is not None:
+            perfil['avisar'](etapa['etapa'])
+    perfil['marca'] = time.perf_counter()
+
+
+def perfil_json(resultado):
+    return json.dumps(resultado, indent=2)
+
+
+def procesar_archivos(defectFile, productionFile, semana_seleccionada, modo_graficas=None, perfil=None, secciones=None):
+    # Como archivar_reporte, pero devuelve el PDF en un BytesIO
+    ruta = archivar_reporte(defectFile, productionFile, semana_seleccionada, modo_graficas, perfil, secciones)
+    return io.BytesIO(leer_reporte(ruta))
+
+
+def archivar_reporte(defectFile, productionFile, semana_seleccionada, modo_graficas=None, perfil=None, secciones=None):
+    # Escribe el PDF directo en la cache en disco y devuelve su ruta: ni el reporte terminado
+    # ni la sesion guardan los bytes en memoria. Un PDF ya generado con los mismos archivos,
+    # semana, secciones, catalogo y codigo se devuelve tal cual, sin parsear ni renderizar nada
+    defectos = leer_contenido(defectFile)
+    produccion = leer_contenido(productionFile)
+    clave = clave_pdf(hash_contenido(defectos), hash_contenido(produccion), semana_seleccionada, modo_graficas, secciones)
+    ruta = ruta_pdf(clave)
+    if os.path.exists(ruta):
+        # La fecha de modificacion marca el ultimo uso para el descarte LRU
+        os.utime(ruta)
+        marcar_etapa(perfil, 'cache PDF')
+        return ruta
+
+    # Los archivos se parsean dentro del reporte y la produccion solo si alguna seccion la usa.
+    # La produccion va completa: el almacen semanal guarda todas las semanas del archivo y
+    # cada seccion toma las suyas
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = ruta_temporal(ruta)
+    try:
+        generar_reporte(lambda: obtener_defectos(defectos),
+                        lambda referencia: obtener_produccion(produccion, referencia=referencia),
+                        semana_seleccionada, modo_graficas, perfil, secciones, destino=temporal)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    # El reporte recien generado no se descarta aunque solo el supere el limite
+    descartar_pdfs(os.path.dirname(ruta), MAX_CACHE_PDF_MB * 2**20, conservar=ruta)
+    return ruta
+
+
+@st.cache_resource
+def cola_reportes():
+    # Una sola cola por servidor, compartida por todas las sesiones. Hilos y no procesos: el
+    # script de Streamlit corre como __main__ y sus funciones no se pueden enviar a otro proceso
+    return {'pool': ThreadPoolExecutor(max_workers=MAX_TRABAJOS, thread_name_prefix='reporte'),
+            'trabajos': {}, 'lock': threading.Lock(),
+            'turnos': threading.Condition(), 'corriendo': 0, 'midiendo': False, 'esperan_memoria': 0}
+
+
+def encolar_reporte(defectFile, productionFile, semana_seleccionada, modo_graficas=None, memoria=False, secciones=None):
+    # Devuelve la clave del trabajo; si ya hay uno igual (pendiente o terminado) lo reutiliza.
+    # Medir memoria da otro perfil, asi que un pedido con memoria no reutiliza uno sin ella
+    defectos = leer_contenido(defectFile)
+    produccion = leer_contenido(productionFile)
+    semana = numero_semana(semana_seleccionada)
+    secciones = secciones_reporte(secciones)
+    clave = (f"{hash_contenido(defectos)}_{hash_contenido(produccion)}_{semana}_{modo_graficas or MODO_GRAFICAS}"
+             f"_{'-'.join(secciones)}{'_memoria' if memoria else ''}")
+    cola = cola_reportes()
+    with cola['lock']:
+        trabajo = cola['trabajos'].get(clave)
+        # Se vuelve a generar si fallo o si su PDF ya se descarto de la cache en disco
+        if trabajo is not None and trabajo['estado'] != 'error' and (
+                trabajo['estado'] != 'listo' or os.path.exists(trabajo['ruta'])):
+            return clave
+        trabajo = {'semana': semana, 'secciones': secciones, 'estado': 'en cola', 'etapa': 'waiting', 'avance': 0.0,
+                   'ruta': None, 'perfil': None, 'error': None, 'terminado': None}
+        cola['trabajos'][clave] = trabajo
+    cola['pool'].submit(ejecutar_reporte, cola, clave, trabajo, defectos, produccion, modo_graficas, memoria)
+    return clave
+
+
+def ejecutar_reporte(cola, clave, trabajo, defectos, produccion, modo_graficas, memoria):
+    def avisar(etapa):
+        trabajo['etapa'] = etapa
+        if etapa in ETAPAS_REPORTE:
+            trabajo['avance'] = (ETAPAS_REPORTE.index(etapa) + 1) / len(ETAPAS_REPORTE)
+
+    tomar_turno(cola, memoria)
+    trabajo['estado'] = 'generando'
+    perfil = iniciar_perfil(memoria, avisar)
+    try:
+        trabajo['ruta'] = archivar_reporte(defectos, produccion, trabajo['semana'], modo_graficas, perfil,
+                                           trabajo['secciones'])
+        trabajo['estado'] = 'listo'
+    except Exception as e:
+        trabajo['error'] = str(e)
+        trabajo['estado'] = 'error'
+    finally:
+        trabajo['perfil'] = terminar_perfil(perfil)
+        soltar_turno(cola)
+        trabajo['terminado'] = time.time()
+        descartar_terminados(cola)
+
+
+def tomar_turno(cola, memoria):
+    # tracemalloc es global y cuenta lo que asignan todos los hilos: un trabajo que mide
+    # memoria corre solo, y mientras espera su turno no empieza ningun otro
+    with cola['turnos']:
+        if memoria:
+            cola['esperan_memoria'] += 1
+            cola['turnos'].wait_for(lambda: cola['corriendo'] == 0)
+            cola['esperan_memoria'] -= 1
+            cola['midiendo'] = True
+        else:
+            cola['turnos'].wait_for(lambda: not cola['midiendo'] and cola['esperan_memoria'] == 0)
+        cola['corriendo'] += 1
+
+
+def soltar_turno(cola):
+    with cola['turnos']:
+        cola['corriendo'] -= 1
+        cola['midiendo'] = False
+        cola['turnos'].notify_all()
+
+
+def descartar_terminados(cola):
+    # Conserva solo los MAX_REPORTES_TERMINADOS reportes terminados mas recientes
+    with cola['lock']:
+        terminados = sorted((trabajo['terminado'], clave) for clave, trabajo in cola['trabajos'].items()
+                            if trabajo['terminado'] is not None)
+        for _, clave in terminados[:-MAX_REPORTES_TERMINADOS]:
+            del cola['trabajos'][clave]
+
+
+def estado_reporte(clave):
+    return cola_reportes()['trabajos'].get(clave)
+
+
+def secciones_reporte(secciones=None):
+    # Secciones pedidas en el orden del PDF; sin seleccion van todas
+    if secciones is None:
+        return list(SECCIONES_REPORTE)
+    desconocidas = [seccion for seccion in secciones if seccion not in SECCIONES_REPORTE]
+    if desconocidas:
+        raise ValueError(f"Unknown report sections: {', '.join(map(str, desconocidas))}")
+    return [seccion for seccion in SECCIONES_REPORTE if seccion in secciones]
+
+
+@functools.lru_cache(maxsize=None)
+def estilos_reporte():
+    # Estilos de tablas (ya compilados como TableStyle) y de titulos del reporte. Se arman
+    # una sola vez por proceso y los comparten todos los reportes; no se deben modificar
     table_style = [
-        ('FONTSIZE', (0,0), (-1,-1), 9), 
+        ('FONTSIZE', (0,0), (-1,-1), 9),
         ('SPAN', (0, 0), (-1, 0)), #Add title
         ('BACKGROUND', (0,0), (-1,0), rl_colors.darkgrey),
         ('ALIGN',(0,0),(-1,0),'CENTER'),
@@ -165,7 +1396,7 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
         ('FONTNAME',(0,-1),(-1,-1),'Helvetica-Bold'),
     ]
     table_style_semana_actual_degradado = [
-        ('FONTSIZE', (0,0), (-1,-1), 9), 
+        ('FONTSIZE', (0,0), (-1,-1), 9),
         ('BACKGROUND', (0,0), (-1,0), rl_colors.darkgrey),
         ('ALIGN',(0,0),(-1,0),'CENTER'),
         ('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'),
@@ -174,7 +1405,7 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
         ('GRID',(0,0),(-1,-1),0.5,rl_colors.black),
     ]
     table_style_semana_actual = [
-        ('FONTSIZE', (0,0), (-1,-1), 9), 
+        ('FONTSIZE', (0,0), (-1,-1), 9),
         ('BACKGROUND', (0,0), (-1,0), rl_colors.darkgrey),
         ('ALIGN',(0,0),(-1,0),'CENTER'),
         ('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'),
@@ -183,7 +1414,7 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
         ('GRID',(0,0),(-1,-1),0.5,rl_colors.black),
     ]
     table_style_graphic = [
-        ('FONTSIZE', (0,0), (-1,-1), 9), 
+        ('FONTSIZE', (0,0), (-1,-1), 9),
         ('BACKGROUND', (0,0), (-1,0), rl_colors.darkgrey),
         ('ALIGN',(0,0),(-1,0),'CENTER'),
         ('FONTNAME',(0,0),(-1,0),'Helvetica-Bold'),
@@ -194,7 +1425,7 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
         ('FONTNAME',(0,-1),(-1,-1),'Helvetica-Bold'),
     ]
     table_style_graphic2 = [
-        ('FONTSIZE', (0,0), (-1,-1), 9), 
+        ('FONTSIZE', (0,0), (-1,-1), 9),
         ('BACKGROUND', (0,0), (-1,0), rl_colors.darkgrey),
         ('ALIGN',(0,0),(-1,0),'CENTER'),
         ('FONTNAME',(0,0),(-1,1),'Helvetica-Bold'),
@@ -206,7 +1437,7 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
     ]
 
     table_style_weeks = [
-        ('FONTSIZE', (0,0), (-1,-1), 9), 
+        ('FONTSIZE', (0,0), (-1,-1), 9),
         ('SPAN', (0, 0), (-1, 0)), #Add title
         ('BACKGROUND', (0,0), (-1,0), rl_colors.darkgrey),
         ('ALIGN',(0,0),(-1,0),'CENTER'),
@@ -218,7 +1449,7 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
         ('FONTNAME',(0,-2),(-1,-1),'Helvetica-Bold'),
     ]
     prod_style = [
-        ('FONTSIZE', (0,0), (-1,-1), 9), 
+        ('FONTSIZE', (0,0), (-1,-1), 9),
         ('SPAN', (0, 0), (-1, 0)), #Add title
         ('BACKGROUND', (0,0), (-1,0), rl_colors.darkgrey),
         ('ALIGN',(0,0),(-1,0),'CENTER'),
@@ -230,7 +1461,7 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
         ('FONTNAME',(0,-2),(-1,-1),'Helvetica-Bold'),
     ]
     prod_style_weeks = [
-        ('FONTSIZE', (0,0), (-1,-1), 9), 
+        ('FONTSIZE', (0,0), (-1,-1), 9),
         ('SPAN', (0, 0), (-1, 0)), #Add title
         ('SPAN', (0,2), (-1,2)),
         ('SPAN', (0,3), (-1,3)),
@@ -253,183 +1484,270 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
         fontSize=20,
         leading=25,
         textColor=rl_colors.black,
-        alignment=TA_LEFT,  
+        alignment=TA_LEFT,
     )
+    sin_misbuilds_style = [
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('FONTSIZE', (0,0), (-1,-1), 12),
+        ('TEXTCOLOR', (0,0), (-1,-1), rl_colors.red)
+    ]
+    return {
+        'table_style': TableStyle(table_style),
+        'table_style_semana_actual_degradado': TableStyle(table_style_semana_actual_degradado),
+        'table_style_semana_actual': TableStyle(table_style_semana_actual),
+        'table_style_graphic': TableStyle(table_style_graphic),
+        'table_style_graphic2': TableStyle(table_style_graphic2),
+        'table_style_weeks': TableStyle(table_style_weeks),
+        'prod_style': TableStyle(prod_style),
+        'prod_style_weeks': TableStyle(prod_style_weeks),
+        'sin_misbuilds_style': TableStyle(sin_misbuilds_style),
+        'custom_title_style': custom_title_style,
+    }
+
+
+# Pagina y margenes del documento (el superior mas pequeño para titulos mas arriba)
+PLANTILLA_DOCUMENTO = dict(
+    pagesize=landscape(letter),
+    leftMargin=20 * mm,
+    rightMargin=20 * mm,
+    topMargin=10 * mm,
+    bottomMargin=20 * mm,
+)
+
+
+# Función para dibujar el fondo de la portada; la etiqueta de la semana se fija con partial
+def draw_cover(etiqueta, canvas, doc):
+    width, height = doc.pagesize
+    canvas.setFillColor(rl_colors.lightgrey)
+    canvas.rect(0, 0, width, height, fill=1, stroke=0)
+
+    # Título centrado
+    canvas.setFont("Helvetica", 50)
+    canvas.setFillColor(rl_colors.black)
+    canvas.drawCentredString(width / 2, height / 2 + 20, "Defects & Warranty")
+    canvas.drawCentredString(width / 2, height / 2 - 35, etiqueta)
+
+
+# Datos compartidos por las secciones. Cada uno se calcula la primera vez que una seccion
+# lo pide (ver dato), asi las secciones que no se piden no cuestan nada
+def calcular_defectos(datos):
+    df = datos['defectos']
+    if callable(df):
+        df = df()
+        marcar_etapa(datos['perfil'], 'ingesta defectos')
+    # El Type ya viene codificado desde la ingesta (ver tipos_defecto)
+    return df[["Date:", "semana_relativa", "semana_natural", "Shipper:", "Original Order or Serial #", "RMA", "RC", "Status? (0,1,2)","Shipping Carrier","Tracking Number",
+            "Staged", "Make / Model", "Claim Type (Description)", "Type", "Pod Number", "Original Build Shop","Original Sales Order Date", "Days" ]]
+
+
+def calcular_produccion(datos):
+    df_transposed = datos['produccion']
+    if callable(df_transposed):
+        # El año de las fechas sin año se ancla a la ultima fecha del libro de defectos
+        df_transposed = df_transposed(dato(datos, 'defectos')['Date:'].max())
+        marcar_etapa(datos['perfil'], 'ingesta produccion')
+    return df_transposed
+
+
+def calcular_cubo(datos):
+    # Conteos de todas las tablas en una sola pasada
+    cubo = construir_cubo(conteos_semanales(dato(datos, 'defectos')), datos['semana'], CATALOGO_DEFECTOS)
+    marcar_etapa(datos['perfil'], 'agregacion')
+    return cubo
+
+
+def calcular_semanas_staged(datos):
+    # Semanas (de las ultimas 4) con algun reclamo; las usan los promedios del resumen
+    current_week_num = datos['semana']
+    return tabla_cubo(dato(datos, 'cubo'), 'Staged', current_week_num-3, current_week_num).columns.tolist()
+
+
+def calcular_produccion_semanal(datos):
+    # Totales por semana desde el almacen incremental
+    prod_semanal = produccion_semanal(dato(datos, 'produccion'))
+    return prod_semanal[['Week', 'Total Orders', 'Total ShippedQty', 'Start Date', 'End Date']]
+
+
+def calcular_semanas_produccion(datos):
+    current_week_num = datos['semana']
+    df_weekly = filtrar_semanas(dato(datos, 'prod_semanal'), current_week_num-3, current_week_num, columna='Week').copy()
+    # Formatear fechas como "DD-MMM" (ej: "22-Apr")
+    df_weekly['Start Date'] = df_weekly['Start Date'].dt.strftime('%d-%b')
+    df_weekly['End Date'] = df_weekly['End Date'].dt.strftime('%d-%b')
+    # Ordenar por semana (opcional)
+    return df_weekly.sort_values('Week', ascending=True)
+
+
+def calcular_historico_produccion(datos):
+    df_weekly8 = filtrar_semanas(dato(datos, 'prod_semanal'), 1, datos['semana'], columna='Week').copy()
+    # Formatear fechas como "DD-MMM" (ej: "22-Apr")
+    df_weekly8['Start Date'] = df_weekly8['Start Date'].dt.strftime('%d-%b')
+    df_weekly8['End Date'] = df_weekly8['End Date'].dt.strftime('%d-%b')
+    # Ordenar por semana (opcional)
+    return df_weekly8.sort_values('Week', ascending=True)
+
+
+def calcular_ordenes_semanales(datos):
+    # Suma de ordenes por semana
+    return dato(datos, 'df_weekly').set_index('Week')['Total Orders']
+
+
+def calcular_semana_actual(datos):
+    df = dato(datos, 'defectos')
+    # Ambos filtros comparan codigos enteros: la semana y el codigo de 'Warranty' en Staged
+    df_semana_actual = df[(df['semana_relativa'] == datos['semana']) & (df['Staged'] == 'Warranty')]
+    df_semana_actual = df_semana_actual[["Date:", "Shipper:", "Original Order or Serial #","RMA",
+                                         "Claim Type (Description)", "Type", "Pod Number", "Original Build Shop", "Original Sales Order Date","Days"]].copy()
+    df_semana_actual['Date:'] = pd.to_datetime(df_semana_actual['Date:']).dt.strftime('%m/%d/%Y')
+    df_semana_actual['Original Sales Order Date'] = pd.to_datetime(
+    df_semana_actual['Original Sales Order Date'],
+    errors='coerce')
+
+    rename_columns = {
+        'Date:': 'Date',
+        'Original Order or Serial #': 'Original Order',
+        'Claim Type (Description)' : 'Description',
+        'Pod Number': 'Pod',
+        'Original Build Shop': 'Warehouse',
+        'Original Sales Order Date':'Build Date'
+    }
+    df_semana_actual = df_semana_actual.rename(columns=rename_columns)
+    df_semana_actual = df_semana_actual.sort_values(by="Build Date")
+
+    # Formatear solo las fechas válidas (dejando nulos como están)
+    df_semana_actual['Build Date'] = df_semana_actual['Build Date'].apply(
+    lambda x: x.strftime('%m/%d/%Y') if not pd.isna(x) else "-")
+
+    df_semana_actual["Pod"] = pd.to_numeric(df_semana_actual["Pod"], errors="coerce")
+    df_semana_actual["Pod"] = df_semana_actual["Pod"].astype("Int64")
+    df_semana_actual["Pod"] = df_semana_actual["Pod"].astype(str).replace("<NA>", "-")
+
+    df_semana_actual["Days"] = pd.to_numeric(df_semana_actual["Days"], errors="coerce")
+    df_semana_actual["Days"] = df_semana_actual["Days"].astype("Int64")
+    df_semana_actual["Days"] = df_semana_actual["Days"].astype(str).replace("<NA>", "-")
+
+    # Las categoricas no aceptan "-" como valor nuevo
+    cat_cols = df_semana_actual.select_dtypes('category').columns
+    df_semana_actual[cat_cols] = df_semana_actual[cat_cols].astype(object)
+    return df_semana_actual.fillna("-")
+
+
+CALCULOS_REPORTE = {
+    'defectos': calcular_defectos,
+    'produccion': calcular_produccion,
+    'cubo': calcular_cubo,
+    'week_cols': calcular_semanas_staged,
+    'prod_semanal': calcular_produccion_semanal,
+    'df_weekly': calcular_semanas_produccion,
+    'df_weekly_hist': calcular_historico_produccion,
+    'weekly_orders_totals': calcular_ordenes_semanales,
+    'df_semana_actual': calcular_semana_actual,
+}
+
+
+def dato(datos, nombre):
+    calculados = datos['calculados']
+    if nombre not in calculados:
+        calculados[nombre] = CALCULOS_REPORTE[nombre](datos)
+    return calculados[nombre]
 
-    current_week_num = int(semana_seleccionada.replace('Week ', ''))
-    fourweeks = [f'Week {i}' for i in range(current_week_num-3, current_week_num+1)]
-    eightweeks = [f'Week {i}' for i in range(current_week_num-7, current_week_num+1)]
-    all_previous_weeks = [f'Week {i}' for i in range(1, current_week_num + 1)]
-    df = df[df['Historical Week'].isin(all_previous_weeks)]
-    df8 = df[df['Historical Week'].isin(eightweeks)]
-    df4 = df[df['Historical Week'].isin(fourweeks)]
 
+def seccion_resumen(datos):
     #Staged
-    story.append(Paragraph("Summary", custom_title_style))
-    staged = pd.crosstab(df4['Staged'], df4['Historical Week'])
+    estilos = datos['estilos']
+    current_week_num = datos['semana']
+    staged = tabla_cubo(dato(datos, 'cubo'), 'Staged', current_week_num-3, current_week_num)
     staged.loc['Total'] = staged.sum(numeric_only=True)
     #Data
-    staged_data = [['Count of Staged by Week']]
-    staged_data += [['Staged'] + staged.columns.tolist()] 
-    for idx, row in staged.iterrows():
-        staged_data.append([idx] + row.astype(int).astype(str).tolist())
+    staged_data = datos_tabla(staged, 'Staged', titulo='Count of Staged by Week')
     #Tabla
     num_filas_staged = len(staged_data)
-    row_heights_staged = [grh] * num_filas_staged
+    row_heights_staged = [ALTO_FILA] * num_filas_staged
     staged_table = Table(staged_data, colWidths=[100, 60, 60, 60, 60], repeatRows=1, rowHeights=row_heights_staged)
-    staged_table.setStyle(TableStyle(table_style))
-
-    #Avg Staged
-    week_cols = [col for col in staged.columns if col.startswith('Week')]
-    # Calcular TOTAL
-    staged['TOTAL'] = staged[week_cols].sum(axis=1)
-    # Contar cuántos valores NO NULOS hay por fila en esas columnas
-    non_null_weeks = staged[week_cols].notnull().sum(axis=1)
-    # Calcular AVG dinámico
-    staged['AVG'] = (staged['TOTAL'] / non_null_weeks).round(0).astype(int)
-    avg = staged[['AVG','TOTAL']].copy()
+    staged_table.setStyle(estilos['table_style'])
+
+    #Avg Staged (promedio sobre las semanas con reclamos)
+    avg = estadisticas_ventana(dato(datos, 'cubo'), staged.index, 'Staged', current_week_num-3, current_week_num)[['AVG','TOTAL']]
     #Tabla
     avg_data = [['Last 4 Weeks']]
     avg_data += [list(avg.columns)]
     avg_data += avg.values.tolist()
     num_filas_staged_avg = len(avg_data)
-    row_heights_staged_avg = [grh] * num_filas_staged_avg 
+    row_heights_staged_avg = [ALTO_FILA] * num_filas_staged_avg
     avg_table = Table(avg_data, colWidths=[60,60], rowHeights=row_heights_staged_avg)
-    avg_table.setStyle(TableStyle(table_style_weeks))
+    avg_table.setStyle(estilos['table_style_weeks'])
     #First Two Tables
     joined_staged = Table([[staged_table, avg_table, '']])
-    story.append(joined_staged)
+    marcar_etapa(datos['perfil'], 'tabla resumen')
+    return [joined_staged]
+
 
+def seccion_garantia(datos):
     #Warranty Details
-    dfwarranty = df4[df4['Staged'] == 'Warranty']
-    warranty = pd.crosstab(dfwarranty['Type'], dfwarranty['Historical Week'])
+    estilos = datos['estilos']
+    current_week_num = datos['semana']
+    cubo = dato(datos, 'cubo')
+    week_cols = dato(datos, 'week_cols')
+    warranty = tabla_cubo(cubo, 'Type', current_week_num-3, current_week_num, staged='Warranty')
     warranty.loc['Total'] = warranty.sum(numeric_only=True)
-    warranty_data = [['Warranty Details']]
-    warranty_data += [['Type'] + warranty.columns.tolist()]
-    for idx, row in warranty.iterrows():
-        warranty_data.append([idx] + row.astype(int).astype(str).tolist())
+    warranty_data = datos_tabla(warranty, 'Type', titulo='Warranty Details')
     #Tabla
     num_filas_w = len(warranty_data)
-    row_heights_w = [grh] * num_filas_w
+    row_heights_w = [ALTO_FILA] * num_filas_w
     warranty_table = Table(warranty_data, colWidths=[100, 60, 60, 60, 60], repeatRows=1, rowHeights=row_heights_w)
-    warranty_table.setStyle(TableStyle(table_style))
+    warranty_table.setStyle(estilos['table_style'])
 
-    #Avg Details
-    warranty['TOTAL'] = warranty[week_cols].sum(axis=1)
-    non_null_weeks_warranty = warranty[week_cols].notnull().sum(axis=1)
-    warranty['AVG'] = (warranty['TOTAL'] / non_null_weeks_warranty).round(0).astype(int)
-    avg_warranty = warranty[['AVG','TOTAL']].copy()
+    #Avg Details (promedio sobre las semanas con cualquier reclamo, como el resumen)
+    avg_warranty = estadisticas_ventana(cubo, warranty.index, 'Type', current_week_num-3, current_week_num,
+                                        staged='Warranty', semanas=len(week_cols))[['AVG','TOTAL']]
     #Tabla 4 weeks
     avg_warranty_data = [['Last 4 Weeks']]
     avg_warranty_data += [list(avg_warranty.columns)]
     avg_warranty_data += avg_warranty.values.tolist()
     num_filas_avg_w = len(avg_warranty_data)
-    row_heights_avg_W = [grh] * num_filas_avg_w
+    row_heights_avg_W = [ALTO_FILA] * num_filas_avg_w
     avg_warranty_table = Table(avg_warranty_data, colWidths=[60,60], rowHeights=row_heights_avg_W)
-    avg_warranty_table.setStyle(TableStyle(table_style_weeks))
+    avg_warranty_table.setStyle(estilos['table_style_weeks'])
     #Tabla 8 weeks
-    dfwarranty8 = df8[df8['Staged'] == 'Warranty']
-    warranty8 = pd.crosstab(dfwarranty8['Type'], df8['Historical Week'])
+    warranty8 = tabla_cubo(cubo, 'Type', current_week_num-7, current_week_num, staged='Warranty')
     warranty8.loc['Total'] = warranty8.sum(numeric_only=True)
-    week_cols8 = [col for col in warranty8.columns if col.startswith('Week')]
-    warranty8['TOTAL'] = warranty8[week_cols8].sum(axis=1)
-    non_null_weeks_warranty8 = warranty8[week_cols8].notnull().sum(axis=1)
-    warranty8['AVG'] = (warranty8['TOTAL'] / non_null_weeks_warranty8).round(0).astype(int)
-    avg_warranty8 = warranty8[['AVG','TOTAL']].copy()
+    avg_warranty8 = estadisticas_ventana(cubo, warranty8.index, 'Type', current_week_num-7, current_week_num,
+                                         staged='Warranty')[['AVG','TOTAL']]
     avg_warranty_data8 = [['Last 8 Weeks']]
     avg_warranty_data8 += [list(avg_warranty8.columns)]
     avg_warranty_data8 += avg_warranty8.values.tolist()
     num_filas_avg_w8 = len(avg_warranty_data8)
-    row_heights_w8 = [grh] * num_filas_avg_w8
+    row_heights_w8 = [ALTO_FILA] * num_filas_avg_w8
     avg_warranty_table8 = Table(avg_warranty_data8, colWidths=[60,60],rowHeights=row_heights_w8)
-    avg_warranty_table8.setStyle(TableStyle(table_style_weeks))
+    avg_warranty_table8.setStyle(estilos['table_style_weeks'])
     #Second Tables
     joined_warranty = Table([[warranty_table,avg_warranty_table,avg_warranty_table8]])
-    story.append(joined_warranty)
+    marcar_etapa(datos['perfil'], 'tabla garantia')
+    return [joined_warranty]
 
-    #ORDENES Y PRODUCCION
 
-    dfprod = pd.read_csv(productionFile, encoding='utf-16',sep='\t', header=1)
-    dfprod = dfprod.drop(columns=[col for col in dfprod.columns 
-                    if 'Unnamed' in str(col) and col != 'Unnamed: 2'])
-    dfprodfilter = dfprod[dfprod['SiteName'] == 'Grand Total']
-    dfprodfilter = dfprodfilter[dfprodfilter['Unnamed: 2'] != 'Shipments']
-    dfprodfilter = dfprodfilter.drop(['Local Operations Shift','Grand Total'], axis=1)
-    dfprodfilter = dfprodfilter.drop(['SiteName'], axis=1)
-    dfprodfilter = dfprodfilter.reset_index(drop=True)
-    #Transponer el DataFrame para que las métricas sean columnas
-    df_transposed = dfprodfilter.set_index('Unnamed: 2').T.reset_index()
-    df_transposed.columns = ['Fecha', 'Orders', 'ShippedQty']  # Renombrar columnas
-    df_transposed['Orders'] = df_transposed['Orders'].astype(int)
-    df_transposed['ShippedQty'] = (
-        df_transposed['ShippedQty']
-        .astype(str)  # Convertir todo a string primero
-        .str.replace('[.,]', '', regex=True)  # Eliminar puntos y comas
-        .replace('nan', np.nan)  # Mantener NaN como valores nulos
-        .astype('Int64')  # Tipo nullable integer de pandas
-    ) # Eliminar comas
-    #Agreagar semanas
-    def convert_date(date_str):
-        # Intenta con el formato preferido primero
-        try:
-            return pd.to_datetime(date_str + '-2025', format='%b %d-%Y')
-        except ValueError:
-            # Fallback 1: Formato sin espacio (ej: "jul-01-2025")
-            try:
-                return pd.to_datetime(date_str + '-2025', format='%b-%d-%Y')
-            except:
-                # Fallback 2: Formato ISO (ej: "2025-07-01")
-                try:
-                    return pd.to_datetime(date_str, format='ISO8601')
-                except:
-                    # Fallback 3: Intento automático
-                    return pd.to_datetime(date_str, format='mixed', dayfirst=False)
-
-    # Aplicar la conversión robusta
-    df_transposed['Fecha'] = df_transposed['Fecha'].apply(convert_date)
-    #df_transposed['Fecha'] = pd.to_datetime(df_transposed['Fecha'] + '-2025', format='%b %d-%Y')
-    df_transposed["semana_relativa"] = (((df_transposed['Fecha'] - fechainicio).dt.days // 7) + 1).astype("Int64")
-    df_transposed["Historical Week"] = 'Week ' + df_transposed["semana_relativa"].astype(str) 
-    df_transposed["semana_natural"] = (((df_transposed["Fecha"] - fechainicio2).dt.days // 7) + 1).astype("Int64")
-    df_transposed["Year Week"] = 'Week ' + df_transposed["semana_natural"].astype(str)
-    df_transposed = df_transposed[['Fecha', 'Historical Week','Year Week','Orders', 'ShippedQty',]]
-
-    df_transposed = df_transposed[df_transposed['Historical Week'].isin(all_previous_weeks)]
-    prod4 = df_transposed[df_transposed['Historical Week'].isin(fourweeks)]
-    prod8 = df_transposed[df_transposed['Historical Week'].isin(eightweeks)]
-
-
-    # Agrupar por 'Historical Week' y sumar Orders/ShippedQty
-    df_weekly = prod4.groupby('Historical Week', as_index=False).agg({
-        'Orders': 'sum',
-        'ShippedQty': 'sum',
-        'Fecha': ['min', 'max']  # Primera y última fecha de la semana
-    })
-    # Renombrar columnas para claridad
-    df_weekly.columns = ['Week', 'Total Orders', 'Total ShippedQty', 'Start Date', 'End Date']
-    # Formatear fechas como "DD-MMM" (ej: "22-Apr")
-    df_weekly['Start Date'] = df_weekly['Start Date'].dt.strftime('%d-%b')
-    df_weekly['End Date'] = df_weekly['End Date'].dt.strftime('%d-%b')
-    # Ordenar por semana (opcional)
-    df_weekly = df_weekly.sort_values('Week', ascending=True)
+def seccion_produccion(datos):
+    #ORDENES Y PRODUCCION
+    estilos = datos['estilos']
+    df_weekly = dato(datos, 'df_weekly')
     #Production Data
     prod_data = [
         ["Production data"],
-        ["", *df_weekly['Week'].tolist()], 
+        ["", *etiquetas_semanas(df_weekly['Week'])],
         ["Start Date"] + df_weekly['Start Date'].tolist(),
         ["End Date"] + df_weekly['End Date'].tolist(),
         ["ASM Clubs"] + [f"{x:,.0f}" for x in df_weekly['Total ShippedQty']],
         ["Orders"] + [f"{x:,.0f}" for x in df_weekly['Total Orders']]
     ]
     num_filas_prod = len(prod_data)
-    row_heights_prod = [grh] * num_filas_prod
+    row_heights_prod = [ALTO_FILA] * num_filas_prod
     prod_tabla = Table(prod_data, colWidths=[100, 60, 60, 60, 60], repeatRows=1, rowHeights=row_heights_prod)
-    prod_tabla.setStyle(TableStyle(prod_style))
+    prod_tabla.setStyle(estilos['prod_style'])
 
     #Avg Details
     # 1. Calcular métricas para ASM Clubs y Orders
     start_date = df_weekly['Start Date'].iloc[0]
-    end_date = df_weekly['End Date'].iloc[-1]  
+    end_date = df_weekly['End Date'].iloc[-1]
     num_semanas = len(df_weekly)
 
     # Para ASM Clubs (Total ShippedQty)
@@ -444,35 +1762,22 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
     avg_prod_data = [
         ["Last 4 Weeks", ""],  # Título combinado
         ["AVG", "TOTAL"],
-        [start_date],  
-        [end_date],  
+        [start_date],
+        [end_date],
         [f"{avg_asm:,}", f"{total_asm:,}"],  # Fila ASM Clubs
         [f"{avg_orders:,}", f"{total_orders:,}"]   # Fila Orders
     ]
     num_filas_prod_avg = len(avg_prod_data)
-    row_heights_prod_avg = [grh] * num_filas_prod_avg 
+    row_heights_prod_avg = [ALTO_FILA] * num_filas_prod_avg
     avg_prod_table = Table(avg_prod_data, colWidths=[60,60], rowHeights=row_heights_prod_avg)
-    avg_prod_table.setStyle(TableStyle(prod_style_weeks))
+    avg_prod_table.setStyle(estilos['prod_style_weeks'])
 
     #8 WEEKS PRODUCTION
-    # Agrupar por 'Historical Week' y sumar Orders/ShippedQty
-    df_weekly8 = df_transposed.groupby('Historical Week', as_index=False).agg({
-        'Orders': 'sum',
-        'ShippedQty': 'sum',
-        'Fecha': ['min', 'max']  # Primera y última fecha de la semana
-    })
-
-    # Renombrar columnas para claridad
-    df_weekly8.columns = ['Week', 'Total Orders', 'Total ShippedQty', 'Start Date', 'End Date']
-    # Formatear fechas como "DD-MMM" (ej: "22-Apr")
-    df_weekly8['Start Date'] = df_weekly8['Start Date'].dt.strftime('%d-%b')
-    df_weekly8['End Date'] = df_weekly8['End Date'].dt.strftime('%d-%b')
-    # Ordenar por semana (opcional)
-    df_weekly8 = df_weekly8.sort_values('Week', ascending=True)
+    df_weekly8 = dato(datos, 'df_weekly_hist')
     #Avg Details
     # 1. Calcular métricas para ASM Clubs y Orders
     start_date8 = df_weekly8['Start Date'].iloc[0]
-    end_date8 = df_weekly8['End Date'].iloc[-1]  
+    end_date8 = df_weekly8['End Date'].iloc[-1]
     num_semanas8 = len(df_weekly8)
 
     # Para ASM Clubs (Total ShippedQty)
@@ -487,41 +1792,41 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
     avg_prod_data8 = [
         ["Historical", ""],  # Título combinado
         ["AVG", "TOTAL"],
-        [start_date8],  
-        [end_date8],  
+        [start_date8],
+        [end_date8],
         [f"{avg_asm8:,}", f"{total_asm8:,}"],  # Fila ASM Clubs
         [f"{avg_orders8:,}", f"{total_orders8:,}"]   # Fila Orders
     ]
     num_filas_avg_prod8 = len(avg_prod_data8)
-    row_heights_avg_prod8 = [grh] * num_filas_avg_prod8 
+    row_heights_avg_prod8 = [ALTO_FILA] * num_filas_avg_prod8
     avg_prod_table8 = Table(avg_prod_data8, colWidths=[60,60], rowHeights=row_heights_avg_prod8)
-    avg_prod_table8.setStyle(TableStyle(prod_style_weeks))
+    avg_prod_table8.setStyle(estilos['prod_style_weeks'])
     joined_prod = Table([[prod_tabla, avg_prod_table,avg_prod_table8]])
-    story.append(joined_prod)
+    marcar_etapa(datos['perfil'], 'tabla produccion')
+    return [joined_prod]
 
+
+def seccion_ordenes(datos):
     #WEEKLY ORDERS
-    # Suma de ordenes por semana
-    weekly_orders_totals = df_weekly.set_index('Week')['Total Orders']
+    estilos = datos['estilos']
+    current_week_num = datos['semana']
+    cubo = dato(datos, 'cubo')
+    week_cols = dato(datos, 'week_cols')
+    weekly_orders_totals = dato(datos, 'weekly_orders_totals')
 
     # Errores de Warranty
-    orders = pd.crosstab(dfwarranty['Type'], dfwarranty['Historical Week'])
+    orders = tabla_cubo(cubo, 'Type', current_week_num-3, current_week_num, staged='Warranty')
     # Division porcentual
     orders_pct = (orders.div(weekly_orders_totals) * 100)
     sum_pct = orders_pct.sum()
 
-    orders_data = [['Weekly Orders']]  # Título modificado
-    orders_data += [['Type'] + orders_pct.columns.tolist()]
-    for idx, row in orders_pct.iterrows():
-        formatted_values = [f"{round(val, 1)}%" if not pd.isna(val) else "0%" for val in row]
-        orders_data.append([idx] + formatted_values)
-
-    # 5. Añadir fila de totales (opcional)
-    orders_data.append(['Order Quality'] + [f"{round(x, 1)}%" for x in sum_pct])
+    # Titulo modificado y fila de totales 'Order Quality'
+    orders_data = datos_tabla(orders_pct, 'Type', titulo='Weekly Orders', porcentaje=True, total='Order Quality')
     num_filas = len(orders_data)
-    row_heights = [grh] * num_filas 
+    row_heights = [ALTO_FILA] * num_filas
     #Tabla
     orders_table = Table(orders_data, colWidths=[100, 60, 60, 60, 60], repeatRows=1, rowHeights=row_heights)
-    orders_table.setStyle(TableStyle(table_style))
+    orders_table.setStyle(estilos['table_style'])
 
     #METODO DE TOTALES
     total_errores = orders.sum().sum()
@@ -531,7 +1836,7 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
     #Avg Orders %
     orders_pct['TOTAL'] = orders_pct[week_cols].sum(axis=1)
     # CORRECCIÓN: Calcula el AVG correctamente (errores totales de categoría / total órdenes)
-    errores_por_categoria = dfwarranty['Type'].value_counts()
+    errores_por_categoria = totales_cubo(cubo, 'Type', current_week_num-3, current_week_num, staged='Warranty')
     orders_pct['AVG'] = (errores_por_categoria / total_ordenes) * 100
 
     avg_orders_pct= orders_pct[['AVG','TOTAL']].copy()
@@ -547,20 +1852,20 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
 
     total_errors = sum_pct[week_cols].sum()
     avg_orders_data.append([
-        f"{avg_weekly_pct.mean().round(1)}%",  
-        f"{total_errors.mean().round(1)}%"           
+        f"{avg_weekly_pct.mean().round(1)}%",
+        f"{total_errors.mean().round(1)}%"
     ])
     num_filas_avg_opct = len(avg_orders_data)
-    row_heights_avg_opct = [grh] * num_filas_avg_opct
+    row_heights_avg_opct = [ALTO_FILA] * num_filas_avg_opct
     avg_orders_table = Table(avg_orders_data, colWidths=[60,60], rowHeights=row_heights_avg_opct)
-    avg_orders_table.setStyle(TableStyle(table_style_weeks))
+    avg_orders_table.setStyle(estilos['table_style_weeks'])
 
     #Historical
     #Avg Orders %
     # Suma de ordenes por semana historico
-    weekly_orders_totals_hist = df_weekly8.set_index('Week')['Total Orders']
+    weekly_orders_totals_hist = dato(datos, 'df_weekly_hist').set_index('Week')['Total Orders']
     # Errores de Warranty
-    orders_hist = pd.crosstab(dfwarranty['Type'], df['Historical Week'])
+    orders_hist = orders.copy()
 
     #METODO DE TOTALES
     total_errores_hist = orders_hist.sum().sum()
@@ -585,212 +1890,101 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
     avg_orders_data_hist = [['Runnig Total']]
     avg_orders_data_hist += [list(avg_orders_pct_hist.columns)]
     avg_orders_data_hist += avg_orders_pct_hist.values.tolist()
-    total_errors_hist = orders_pct_hist[orders_hist.columns].sum().sum() 
+    total_errors_hist = orders_pct_hist[orders_hist.columns].sum().sum()
     avg_orders_data_hist.append([
-        f"{avg_weekly_pct_hist.round(1)}%",  
-        f"{total_errors_hist.mean().round(1)}%"           
+        f"{avg_weekly_pct_hist.round(1)}%",
+        f"{total_errors_hist.mean().round(1)}%"
     ])
     num_filas_avg_opct_hist = len(avg_orders_data_hist)
-    row_heights_avg_opct_hist = [grh] * num_filas_avg_opct_hist
+    row_heights_avg_opct_hist = [ALTO_FILA] * num_filas_avg_opct_hist
     avg_orders_table_hist = Table(avg_orders_data_hist, colWidths=[60,60], rowHeights=row_heights_avg_opct_hist)
-    avg_orders_table_hist.setStyle(TableStyle(table_style_weeks))
+    avg_orders_table_hist.setStyle(estilos['table_style_weeks'])
 
     orders_joined = Table([[orders_table, avg_orders_table, avg_orders_table_hist]])
-    story.append(orders_joined)
+    marcar_etapa(datos['perfil'], 'tabla ordenes')
+    return [orders_joined]
 
-    story.append(PageBreak())
 
+def seccion_devoluciones(datos):
     #Grafica
-    story.append(Paragraph("Returns per Week by Reason Code", custom_title_style))
+    estilos = datos['estilos']
+    perfil = datos['perfil']
+    current_week_num = datos['semana']
+    cubo = dato(datos, 'cubo')
+    story = [Paragraph("Returns per Week by Reason Code", estilos['custom_title_style'])]
     #DATA
     #Warranty Details
-    warranty_hist1 = pd.crosstab(df['Type'], df['Historical Week'])
+    warranty_hist1 = tabla_cubo(cubo, 'Type', 1, current_week_num)
 
     # CORRECCIÓN: Usar warranty_hist en lugar de warranty
     warranty_hist1.loc['Total'] = warranty_hist1.sum(numeric_only=True)
 
-    warranty_hist8 = pd.crosstab(df8['Type'], df8['Historical Week'])
+    warranty_hist8 = tabla_cubo(cubo, 'Type', current_week_num-7, current_week_num)
     warranty_hist8.loc['Total'] = warranty_hist8.sum(numeric_only=True)
-    # 2. Preparar datos para el DataFrame
-    #warranty_hist = [['Warranty Details']]
-    warranty_hist = [['Type'] + warranty_hist8.columns.tolist()]
-    for idx, row in warranty_hist8.iterrows():
-        warranty_hist.append([idx] + row.astype(int).astype(str).tolist())
-
-    warranty_data_hist_FG = [['Type'] + warranty_hist1.columns.tolist()]
-
-    for idx, row in warranty_hist1.iterrows():
-        row_values = []
-        for val in row:
-            if pd.isna(val):
-                row_values.append('0')
-            else:
-                row_values.append(str(int(val)))
-        warranty_data_hist_FG.append([idx] + row_values)
-
-    # 3. Crear DataFrame
-    df_warranty_hist = pd.DataFrame(warranty_data_hist_FG[1:], columns=warranty_data_hist_FG[0])
-    df_warranty_hist.set_index('Type', inplace=True)
-    df_warranty_hist = df_warranty_hist.apply(pd.to_numeric)
-
-    # 4. Preparar datos para gráfico (excluyendo 'Total')
-    plot_data = df_warranty_hist.drop('Total', errors='ignore')
+    # Preparar datos para gráfico (excluyendo 'Total'), con las semanas como etiquetas
+    plot_data = warranty_hist1.drop('Total', errors='ignore').fillna(0).astype(int)
+    plot_data.columns = etiquetas_semanas(plot_data.columns)
 
     # 5. Configurar gráfico
-    plt.figure(figsize=(12, 8))
     markers = ['o', 's', '^', 'D', 'v', 'p', '*']
-    colors = plt.cm.tab20(np.linspace(0, 1, len(plot_data)))
-
-    # 6. Graficar cada línea
-    for i, (idx, row) in enumerate(plot_data.iterrows()):
-        plt.plot(row.index, row.values, 
-                marker=markers[i%len(markers)],
-                linestyle='--',
-                linewidth=2,
-                markersize=8,
-                color=colors[i],
-                label=idx)
-
-    # 7. Personalización del gráfico
-    #plt.title('Returns per Week by Reason Code', fontsize=16, pad=20)
-    #plt.xlabel('Week', fontsize=12)
-    #plt.ylabel('Number of Returns', fontsize=12)
-    plt.xticks(rotation=45)
-    plt.grid(True, linestyle='--', alpha=0.6)
-    plt.legend(title='Outcome', bbox_to_anchor=(1.05, 1), loc='upper left',fontsize=11.5,borderpad=1.2,labelspacing=1.2)
-    plt.tight_layout()
-
-    # 8. Añadir etiquetas de valores
-    for idx, row in plot_data.iterrows():
-        for week, val in row.items():
-            if val > 0:
-                plt.text(week, val + 0.5, str(val), 
-                        ha='center', va='bottom', 
-                        fontsize=9, color=colors[plot_data.index.get_loc(idx)])
-
-    # Guardar imagen temporal
-    plt.savefig("graphic.png", dpi=300)
-    plt.close()
-
-    # Insertar la imagen (gráfica)
-    story.append(Image("graphic.png", width=750, height=250))  
+    colors = colormaps['tab20'](np.linspace(0, 1, len(plot_data)))
+    series_devoluciones = [
+        {'nombre': idx, 'valores': valores, 'color': colors[i], 'marker': markers[i%len(markers)],
+         'linestyle': '--', 'markersize': 8}
+        for i, (idx, valores) in enumerate(zip(plot_data.index, plot_data.to_numpy()))
+    ]
+
+    # Insertar la gráfica (vectorial o imagen renderizada en memoria)
+    story.append(grafica_lineas(plot_data.columns.tolist(), series_devoluciones, width=750, height=250,
+                                figsize=(12, 8), leyenda_titulo='Outcome', leyenda_fuera=True,
+                                grid_alpha=0.6, etiquetas_valores=True, modo=datos['modo_graficas']))
+    marcar_etapa(perfil, 'grafica devoluciones')
 
 
     # 2. Preparar datos para la tabla de historial
-    hist_data = [['Type'] + warranty_hist8.columns.tolist()]
-    for idx, row in warranty_hist8.iterrows():
-        hist_data.append([idx] + row.astype(int).astype(str).tolist())
+    hist_data = datos_tabla(warranty_hist8, 'Type')
 
     # 3. Crear tabla de historial
     num_filas_warranty_hist = len(hist_data)
-    row_heights_w_hist = [grh] * num_filas_warranty_hist
+    row_heights_w_hist = [ALTO_FILA] * num_filas_warranty_hist
     warranty_table_hist = Table(hist_data, colWidths=[100, 58, 58, 58, 58], repeatRows=1, rowHeights=row_heights_w_hist)
-    warranty_table_hist.setStyle(TableStyle(table_style_graphic))
-    # 4. Calcular los datos de resumen
-    last_8_weeks = warranty_hist8.iloc[:, -8:].sum(axis=1) #if len(warranty_hist8.columns) <= 8 else pd.Series(0, index=warranty_hist8.index)
-    weeks_5_to_8 = warranty_hist8.iloc[:, -8:-4].sum(axis=1) #if len(warranty_hist8.columns) <= 8 else pd.Series(0, index=warranty_hist8.index)
-    last_4_weeks = warranty_hist8.iloc[:, -4:].sum(axis=1) #if len(warranty_hist8.columns) >= 4 else pd.Series(0, index=warranty_hist8.index)
+    warranty_table_hist.setStyle(estilos['table_style_graphic'])
+    # 4. Calcular los datos de resumen (ultimas 4 semanas contra las 4 anteriores)
+    ventana = estadisticas_ventana(cubo, warranty_hist8.index, 'Type', current_week_num-3, current_week_num)
 
     # 5. Preparar datos para la tabla de resumen
-    summary_data = [['Type','Last 4 Weeks', 'Weeks 5-8', 'Dif','Last 8 Weeks']]
-    for idx in warranty_hist8.index:
-        summary_data.append([
-            idx,
-            str(int(last_4_weeks[idx])),
-            str(int(weeks_5_to_8[idx])),
-            str(int(last_4_weeks[idx])-int(weeks_5_to_8[idx])),
-            str(int(last_8_weeks[idx]))        
-        ])
+    summary = pd.DataFrame({'Last 4 Weeks': ventana['TOTAL'], 'Weeks 5-8': ventana['ANTERIOR'],
+                            'Dif': ventana['DELTA'], 'Last 8 Weeks': ventana['TOTAL'] + ventana['ANTERIOR']})
+    summary_data = datos_tabla(summary, 'Type', columnas=summary.columns)
 
     # 6. Crear tabla de resumen
     summary_table = Table(summary_data, colWidths=[100,58, 58, 58, 58], repeatRows=1, rowHeights=row_heights_w_hist)
-    summary_table.setStyle(TableStyle(table_style_graphic))
+    summary_table.setStyle(estilos['table_style_graphic'])
     graphic_joined = Table([[warranty_table_hist, summary_table]])
     story.append(graphic_joined)
+    marcar_etapa(perfil, 'tablas devoluciones')
+    return story
 
-    story.append(PageBreak())
 
+def seccion_semana_actual(datos):
     #TABLA SEMANA ACTUAL
-    story.append(Paragraph("Warranty Defects Of the Week", custom_title_style))
-    df_semana_actual = df[df['Historical Week'].str.strip() == semana_actual.strip()].copy()
-    df_semana_actual = df_semana_actual[df_semana_actual['Staged'] == 'Warranty']
-    df_semana_actual = df_semana_actual[["Date:", "Shipper:", "Original Order or Serial #","RMA", 
-                                         "Claim Type (Description)", "Type", "Pod Number", "Original Build Shop", "Original Sales Order Date","Days"]]
-    df_semana_actual['Date:'] = pd.to_datetime(df_semana_actual['Date:']).dt.strftime('%m/%d/%Y')
-    df_semana_actual['Original Sales Order Date'] = pd.to_datetime(
-    df_semana_actual['Original Sales Order Date'], 
-    errors='coerce')
-    
-    rename_columns = {
-        'Date:': 'Date',
-        'Original Order or Serial #': 'Original Order',
-        'Claim Type (Description)' : 'Description',
-        'Pod Number': 'Pod',
-        'Original Build Shop': 'Warehouse',
-        'Original Sales Order Date':'Build Date'
-    }
-    df_semana_actual = df_semana_actual.rename(columns=rename_columns)
-    df_semana_actual = df_semana_actual.sort_values(by="Build Date")
-
-    # Convertir fechas a datetime para el degradado (antes de formatear como string)
-    #dates_for_gradient = pd.to_datetime(df_semana_actual['Build Date'], errors='coerce')
-    #min_date = dates_for_gradient.min()
-    #max_date = dates_for_gradient.max()
-
-    # Formatear solo las fechas válidas (dejando nulos como están)
-    df_semana_actual['Build Date'] = df_semana_actual['Build Date'].apply(
-    lambda x: x.strftime('%m/%d/%Y') if not pd.isna(x) else "-")
-    
-    df_semana_actual["Pod"] = pd.to_numeric(df_semana_actual["Pod"], errors="coerce")
-    df_semana_actual["Pod"] = df_semana_actual["Pod"].astype("Int64")
-    df_semana_actual["Pod"] = df_semana_actual["Pod"].astype(str).replace("<NA>", "-")
-    
-    df_semana_actual["Days"] = pd.to_numeric(df_semana_actual["Days"], errors="coerce")
-    df_semana_actual["Days"] = df_semana_actual["Days"].astype("Int64")
-    df_semana_actual["Days"] = df_semana_actual["Days"].astype(str).replace("<NA>", "-")
+    estilos = datos['estilos']
+    story = [Paragraph("Warranty Defects Of the Week", estilos['custom_title_style'])]
+    df_semana_actual = dato(datos, 'df_semana_actual')
 
-    df_semana_actual = df_semana_actual.fillna("-")
-    
-    semana_actual_data = [df_semana_actual.columns.tolist()]  # Encabezados
-    semana_actual_data += df_semana_actual.values.tolist()    # Datos
-    semana_actual_table = Table(semana_actual_data,repeatRows=1)
-
-    #num_rows = len(df_semana_actual)  # número de filas reales de datos (sin encabezado)
-    #build_date_col = df_semana_actual.columns.get_loc("Build Date")
-
-    #for row_idx, date in enumerate(dates_for_gradient, start=1):  # start=1 porque la primera fila es encabezado
-    #    if row_idx > num_rows:
-    #        break  # Evitar acceder a una fila que no existe en la tabla
-
-    #    if not pd.isna(date):
-    #        ratio = (date - min_date) / (max_date - min_date) if max_date != min_date else 0.5
-    #        inverted_ratio = 1 - ratio
-    #        color = rl_colors.Color(
-    #            0.8 - 0.7 * inverted_ratio,  # Rojo: comienza en 1.0 (amarillo) y disminuye a 0
-    #            0.7 + 0.1 * inverted_ratio,          # Verde: siempre al máximo (1.0)
-    #            0.1           # Azul: siempre 0
-    #        )
-    #        table_style_semana_actual_degradado.append(
-    #            ('BACKGROUND', (build_date_col, row_idx), (build_date_col, row_idx), color))
-    #    else:
-    #        table_style_semana_actual_degradado.append(
-    #            ('BACKGROUND', (build_date_col, row_idx), (build_date_col, row_idx), rl_colors.lightgrey))
-
-
-    semana_actual_table.setStyle(TableStyle(table_style_semana_actual_degradado))
+    semana_actual_table = TablaDetalle(df_semana_actual.columns.tolist(), df_semana_actual.values.tolist(),
+                                       estilos['table_style_semana_actual_degradado'])
     story.append(semana_actual_table)
+    marcar_etapa(datos['perfil'], 'tabla semana actual')
+    return story
 
-    story.append(PageBreak())
 
+def seccion_asm(datos):
     #Resumen de ordenes
-    story.append(Paragraph("Assembly Clubs and Orders Over Time", custom_title_style))
-    df_weekly8 = prod8.groupby('Historical Week', as_index=False).agg({
-        'Orders': 'sum',
-        'ShippedQty': 'sum',
-        'Fecha': ['min', 'max']  # Primera y última fecha de la semana
-    })
-    # Renombrar columnas para claridad
-    df_weekly8.columns = ['Week', 'Total Orders', 'Total ShippedQty','Start Date', 'End Date',]
+    estilos = datos['estilos']
+    current_week_num = datos['semana']
+    story = [Paragraph("Assembly Clubs and Orders Over Time", estilos['custom_title_style'])]
+    df_weekly8 = filtrar_semanas(dato(datos, 'prod_semanal'), current_week_num-7, current_week_num, columna='Week').copy()
     # Formatear fechas como "DD-MMM" (ej: "22-Apr")
     df_weekly8['Start Date'] = df_weekly8['Start Date'].dt.strftime('%d-%b')
     df_weekly8['End Date'] = df_weekly8['End Date'].dt.strftime('%d-%b')
@@ -799,292 +1993,307 @@ def procesar_archivos(defectFile, productionFile, semana_seleccionada):
         'Total Orders': 'ASM Orders',
     }
     df_weekly8 = df_weekly8.rename(columns=rename_columns_weekly8)
+    df_weekly8['Week'] = etiquetas_semanas(df_weekly8['Week'])
     df_weekly8 = df_weekly8 [['Week', 'Start Date', 'End Date', 'ASM Clubs', 'ASM Orders']]
     df_weekly8_data = [df_weekly8.columns.tolist()]
     df_weekly8_data += df_weekly8.values.tolist()
     df_weekly8_table = Table(df_weekly8_data)
-    df_weekly8_table.setStyle(TableStyle(table_style_semana_actual))
+    df_weekly8_table.setStyle(estilos['table_style_semana_actual'])
     story.append(Spacer(width=0, height=0.3*cm))
     story.append(df_weekly8_table)
+    marcar_etapa(datos['perfil'], 'tabla ASM')
 
     #Grafica ASM clubs and orders
-    # Crear figura y eje principal
-    fig, ax1 = plt.subplots(figsize=(12, 6))
-    #Segunda Linea
-    ax2= ax1.twinx()
-
-    # Gráfico de Misbuilds (eje izquierdo - rojo)
-    ax1.plot(df_weekly8['Week'], df_weekly8['ASM Clubs'], 
-            label='ASM Clubs', 
-            color='red', 
-            marker='s', 
-            linestyle='--', 
-            linewidth=2)
-    ax1.set_ylabel('ASM Clubs', color='black') 
-    ax1.tick_params(axis='y', labelcolor='black')
-    # Gráfico de Total de ordenes (eje derecho - azul)
-    ax2.plot(df_weekly8['Week'], df_weekly8['ASM Orders'], 
-            label='ASM Orders', 
-            color='blue', 
-            marker='o', 
-            linestyle='-', 
-            linewidth=2)
-    ax2.set_ylabel('ASM Orders', color='black')  
-    ax2.tick_params(axis='y', labelcolor='black')
-
-    # Combinar leyendas
-    lines1, labels1 = ax1.get_legend_handles_labels()
-    lines2, labels2 = ax2.get_legend_handles_labels()
-    ax1.legend(lines1 + lines2, labels1 + labels2, fontsize=10, loc='upper left')
+    # ASM Clubs en el eje izquierdo (rojo) y ordenes en el derecho (azul)
+    series_asm = [{'nombre': 'ASM Clubs', 'valores': df_weekly8['ASM Clubs'].to_numpy(), 'color': 'red', 'marker': 's', 'linestyle': '--'}]
+    series_ordenes = [{'nombre': 'ASM Orders', 'valores': df_weekly8['ASM Orders'].to_numpy(), 'color': 'blue', 'marker': 'o', 'linestyle': '-'}]
 
-    # Ajustar formato
-    plt.xticks(rotation=45)
-    fig.tight_layout()
-
-    # Guardar imagen temporal
-    plt.savefig("graphic3.png", dpi=300)
-    plt.close()
-
-    # Insertar la imagen (gráfica)
+    # Insertar la gráfica (vectorial o imagen renderizada en memoria)
     story.append(Spacer(width=0, height=1*cm))
-    story.append(Image("graphic3.png", width=750, height=300)) 
+    story.append(grafica_lineas(df_weekly8['Week'].tolist(), series_asm, width=750, height=300, figsize=(12, 6),
+                                eje_derecho=series_ordenes, titulos_ejes=('ASM Clubs', 'ASM Orders'),
+                                modo=datos['modo_graficas']))
+    marcar_etapa(datos['perfil'], 'grafica ASM')
+    return story
 
-    story.append(PageBreak())
 
+def seccion_misbuilds(datos):
     #Misbuilds
+    estilos = datos['estilos']
+    perfil = datos['perfil']
+    current_week_num = datos['semana']
+    custom_title_style = estilos['custom_title_style']
+    story = []
+    df_semana_actual = dato(datos, 'df_semana_actual')
     df_misbuild = df_semana_actual[df_semana_actual['Type'] == 'FRMISBUILD']
     if df_misbuild.empty:
     # Crear tabla vacía con estructura similar
         misbuild_data = [['No misbuilds found this week']]
         misbuild_table = Table(misbuild_data, colWidths=[400])
-        misbuild_table.setStyle(TableStyle([
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('FONTSIZE', (0,0), (-1,-1), 12),
-            ('TEXTCOLOR', (0,0), (-1,-1), rl_colors.red)
-        ]))
-        story.append(misbuild_table)
-    else: 
-        story.append(Paragraph("Misbuilds Summary Of the Week", custom_title_style))
-        story.append(Spacer(width=0, height=0.3*cm))
-        misbuild_data = [df_misbuild.columns.tolist()]  # Encabezados
-        misbuild_data += df_misbuild.values.tolist()    # Datos
-        misbuild_table = Table(misbuild_data)
-        misbuild_table.setStyle(TableStyle(table_style_semana_actual))
+        misbuild_table.setStyle(estilos['sin_misbuilds_style'])
         story.append(misbuild_table)
+        marcar_etapa(perfil, 'tablas misbuilds')
+        return story
 
-        count_misbuilds = df4[df4['Type'] == 'FRMISBUILD']
-        rename_columns_misbuilds = {
-            'Claim Type (Description)': 'Description',
-        }
-        count_misbuilds = count_misbuilds.rename(columns=rename_columns_misbuilds)
-        count_misbuilds = pd.crosstab(count_misbuilds['Description'], count_misbuilds['Historical Week'])
-        count_misbuilds.loc['Total'] = count_misbuilds.sum(numeric_only=True)
-        count_misbuilds_data =[['Count of Misbuilds']]
-        count_misbuilds_data += [['Description'] + count_misbuilds.columns.tolist()]
-        for idx, row in count_misbuilds.iterrows():
-            count_misbuilds_data.append([idx] + row.astype(int).astype(str).tolist())
-        #Tabla
-        num_filas_cm = len(count_misbuilds_data)
-        row_heights_cm = [grh] * num_filas_cm
-        count_misbuilds_table = Table(count_misbuilds_data, colWidths=[150, 60, 60, 60, 60], repeatRows=1, rowHeights=row_heights_cm)
-        count_misbuilds_table.setStyle(TableStyle(table_style))
-
-        #Avg Details
-        week_cols_cm = [col for col in count_misbuilds.columns if col.startswith('Week')]
-        count_misbuilds['TOTAL'] = count_misbuilds[week_cols_cm].sum(axis=1)
-        non_null_weeks_countm = count_misbuilds[week_cols_cm].notnull().sum(axis=1)
-        count_misbuilds['AVG'] = (count_misbuilds['TOTAL'] / non_null_weeks_countm).round(0).astype(int)
-        avg_cm = count_misbuilds[['AVG','TOTAL']].copy()
-        #Tabla 4 weeks
-        avg_cm_data = [['Last 4 Weeks']]
-        avg_cm_data += [list(avg_cm.columns)]
-        avg_cm_data += avg_cm.values.tolist()
-        num_filas_avg_cm = len(avg_cm_data)
-        row_heights_avg_cm = [grh] * num_filas_avg_cm
-        avg_cm_table = Table(avg_cm_data, colWidths=[60,60], rowHeights=row_heights_avg_cm)
-        avg_cm_table.setStyle(TableStyle(table_style_weeks))
-
-        story.append(Spacer(width=0, height=1.5*cm))
-
-        joined_cm = Table([[count_misbuilds_table, avg_cm_table]])
-        story.append(joined_cm)
-        story.append(Spacer(width=0, height=1.5*cm))
-        # 1. Preparar los datos base (igual que antes)
-        prod_data_cm = [
-            ["Production data"],
-            ["", *df_weekly['Week'].tolist()], 
-            ["Start Date"] + df_weekly['Start Date'].tolist(),
-            ["End Date"] + df_weekly['End Date'].tolist(),
-            ["ASM Clubs"] + [f"{x:,.0f}" for x in df_weekly['Total ShippedQty']],
-            ["Orders"] + [f"{x:,.0f}" for x in df_weekly['Total Orders']]
-        ]
-
-        # 2. Calcular las nuevas filas
-        misbuilds_per_orders = []
-        complemento_100 = []  # Nueva lista para 100% - Misbuilds/Orders
-
-        for week in df_weekly['Week']:
-            # Obtener el valor numérico REAL de misbuilds (3 métodos seguros)
-            try:
-                # Método 1: Si count_misbuilds es un DataFrame
-                if isinstance(count_misbuilds, pd.DataFrame):
-                    misbuilds = count_misbuilds.loc[week].iloc[0] if week in count_misbuilds.index else 0
-                # Método 2: Si es una Serie
-                elif isinstance(count_misbuilds, pd.Series):
-                    misbuilds = count_misbuilds[week] if week in count_misbuilds.index else 0
-                # Método 3: Si es un diccionario u otro tipo
-                else:
-                    misbuilds = count_misbuilds.get(week, 0)
-            except (KeyError, IndexError):
-                misbuilds = 0
-            
-            # Convertir a float explícitamente (seguro)
-            misbuilds = float(misbuilds)
-            
-            # Obtener orders (asegurarse que es un valor numérico)
-            orders = float(df_weekly[df_weekly['Week'] == week]['Total Orders'].iloc[0])
-            
-            # Calcular ratios con protección completa
-            ratio_orders = misbuilds / orders if orders != 0 else 0
-            ratio_complemento = (1 - ratio_orders) if orders != 0 else 1
-            
-            # Formatear (Misbuilds/Orders como decimal, complemento como porcentaje)
-            misbuilds_per_orders.append(f"{ratio_orders: .2%}")
-            complemento_100.append(f"{ratio_complemento:.2%}")  # Formato de porcentaje
-
-        # 3. Agregar las filas a la tabla
-        prod_data_cm.append(["Misbuild of Orders"] + misbuilds_per_orders)
-        prod_data_cm.append(["Build Quality"] + complemento_100)  # Nueva fila modificada
-
-        # 4. Crear la tabla con ReportLab
-        prod_cm_table = Table(
-            prod_data_cm,
-            colWidths=[100] + [60] * len(df_weekly),  # Ajusta según necesidad
-        )
-        prod_cm_table.setStyle(prod_style)
-        prod_cm_joined = Table([[prod_cm_table, '']])
-        story.append(prod_cm_joined)
+    cubo = dato(datos, 'cubo')
+    df_weekly = dato(datos, 'df_weekly')
+    weekly_orders_totals = dato(datos, 'weekly_orders_totals')
+    story.append(Paragraph("Misbuilds Summary Of the Week", custom_title_style))
+    story.append(Spacer(width=0, height=0.3*cm))
+    misbuild_table = TablaDetalle(df_misbuild.columns.tolist(), df_misbuild.values.tolist(),
+                                  estilos['table_style_semana_actual'], repetir_encabezado=False)
+    story.append(misbuild_table)
 
-        story.append(PageBreak())
+    count_misbuilds = tabla_cubo(cubo, 'Description', current_week_num-3, current_week_num, tipo='FRMISBUILD')
+    count_misbuilds.loc['Total'] = count_misbuilds.sum(numeric_only=True)
+    count_misbuilds_data = datos_tabla(count_misbuilds, 'Description', titulo='Count of Misbuilds')
+    #Tabla
+    num_filas_cm = len(count_misbuilds_data)
+    row_heights_cm = [ALTO_FILA] * num_filas_cm
+    count_misbuilds_table = Table(count_misbuilds_data, colWidths=[150, 60, 60, 60, 60], repeatRows=1, rowHeights=row_heights_cm)
+    count_misbuilds_table.setStyle(estilos['table_style'])
 
-        # HISTORICO MISBUILDS
-        
-        story.append(Paragraph("Misbuilds and Orders Over Time", custom_title_style))
-        story.append(Spacer(width=0, height=0.3*cm))
-        count_misbuilds8 = df8[df8['Type'] == 'FRMISBUILD']
-        rename_columns_misbuilds8 = {
-            'Claim Type (Description)': 'Description',
-        }
-        count_misbuilds8 = count_misbuilds8.rename(columns=rename_columns_misbuilds8)
-        count_misbuilds8 = pd.crosstab(count_misbuilds8['Description'], count_misbuilds8['Historical Week'])
-        count_misbuilds8.loc['Total'] = count_misbuilds8.sum(numeric_only=True)
-        #count_misbuilds_data8 =[['Count of Misbuilds']]
-        count_misbuilds_data8 = [['Description'] + count_misbuilds8.columns.tolist()]
-        for idx, row in count_misbuilds8.iterrows():
-            count_misbuilds_data8.append([idx] + row.astype(int).astype(str).tolist())
-
-        # 3. Crear tabla de historial
-        num_filas_misbuilds8 = len(count_misbuilds_data8)
-        row_heights_mis8 = [grh] * num_filas_misbuilds8
-        count_misbuilds_table8 = Table(count_misbuilds_data8, colWidths=[150, 58, 58, 58, 58, 58], repeatRows=1, rowHeights=row_heights_mis8)
-        count_misbuilds_table8.setStyle(TableStyle(table_style_graphic))
-        # 4. Calcular los datos de resumen
-        mb_last_8_weeks = count_misbuilds8.iloc[:, -8:].sum(axis=1) #if len(warranty_hist8.columns) <= 8 else pd.Series(0, index=warranty_hist8.index)
-        mb_weeks_5_to_8 = count_misbuilds8.iloc[:, -8:-4].sum(axis=1) #if len(warranty_hist8.columns) <= 8 else pd.Series(0, index=warranty_hist8.index)
-        mb_last_4_weeks = count_misbuilds8.iloc[:, -4:].sum(axis=1) #if len(warranty_hist8.columns) >= 4 else pd.Series(0, index=warranty_hist8.index)
-
-        # 5. Preparar datos para la tabla de resumen
-        summary_data_mis8 = [['Last 4 Weeks', 'Weeks 5-8', 'Dif','Total']]
-        for idx in count_misbuilds8.index:
-            summary_data_mis8.append([
-                str(int(mb_last_4_weeks[idx])),
-                str(int(mb_weeks_5_to_8[idx])),
-                str(int(mb_last_4_weeks[idx])-int(mb_weeks_5_to_8[idx])),
-                str(int(mb_last_8_weeks[idx]))        
-            ])
-
-        # 6. Crear tabla de resumen
-        summary_table_mis8 = Table(summary_data_mis8, colWidths=[58, 58, 58, 58], repeatRows=1, rowHeights=row_heights_mis8)
-        summary_table_mis8.setStyle(TableStyle(table_style_graphic2))
-        graphic_joined_mis8 = Table([[count_misbuilds_table8, summary_table_mis8]])
-        story.append(graphic_joined_mis8)
-
-        #GRAFICA
-        # Gráfico de líneas
-        misbuilds_counts = df[df['Type'] == 'FRMISBUILD'].groupby('Historical Week').size()
-        misbuilds_counts = misbuilds_counts.reindex(df_weekly['Week'], fill_value=0)
-        # 2. Calcular el promedio móvil de 4 semanas
-        misbuilds_4wk_avg = misbuilds_counts.rolling(window=4, min_periods=1).mean()
-        # Crear figura y eje principal (misbuilds)
-        fig, ax1 = plt.subplots(figsize=(12, 6))
-
-        # Gráfico de Misbuilds (eje izquierdo - rojo)
-        ax1.plot(misbuilds_counts.index, misbuilds_counts.values, 
-                label='Total Misbuilds', 
-                color='red', 
-                marker='s', 
-                linestyle='--', 
-                linewidth=2)
-
-        # Gráfico de Promedio Móvil (eje izquierdo - verde)
-        ax1.plot(misbuilds_4wk_avg.index, misbuilds_4wk_avg.values, 
-                label='4 Week Avg', 
-                color='green', 
-                marker='^', 
-                linestyle='-.', 
-                linewidth=2)
-        ax1.tick_params(axis='y')
-        ax1.grid(True, linestyle='--', alpha=0.3)
-
-        # Crear eje secundario (derecho - azul)
-        ax2 = ax1.twinx()
-
-        # Gráfico de Total de ordenes (eje derecho - azul)
-        ax2.plot(df_weekly['Week'], df_weekly['Total Orders'], 
-                label='Total Orders', 
-                color='blue', 
-                marker='o', 
-                linestyle='-', 
-                linewidth=2)
-        ax2.tick_params(axis='y')
-
-        # Título y leyenda unificada
-        #plt.title('Misbuilds and Orders over Time', fontsize=14, pad=20)
-
-        # Combinar leyendas
-        lines1, labels1 = ax1.get_legend_handles_labels()
-        lines2, labels2 = ax2.get_legend_handles_labels()
-        ax1.legend(lines1 + lines2, labels1 + labels2, fontsize=10, loc='upper left')
-
-        # Ajustar formato
-        plt.xticks(rotation=45)
-        fig.tight_layout()
-
-        # Guardar imagen temporal
-        plt.savefig("graphic2.png", dpi=300)
-        plt.close()
-
-        # Insertar la imagen (gráfica)
-        story.append(Spacer(width=0, height=1*cm))
-        story.append(Image("graphic2.png", width=750, height=300)) 
-
-        # Función para dibujar el fondo
-    def draw_cover(canvas, doc):
-        width, height = doc.pagesize
-        canvas.setFillColor(rl_colors.lightgrey)
-        canvas.rect(0, 0, width, height, fill=1, stroke=0)
-
-        # Título centrado
-        canvas.setFont("Helvetica", 50)
-        canvas.setFillColor(rl_colors.black)
-        canvas.drawCentredString(width / 2, height / 2 + 20, "Defects & Warranty")
-        canvas.drawCentredString(width / 2, height / 2 - 35, f"{semana_seleccionada}")
-
-    # Guardar
-    doc.build(story, onFirstPage=draw_cover)
+    #Avg Details
+    avg_cm = estadisticas_ventana(cubo, count_misbuilds.index, 'Description', current_week_num-3, current_week_num,
+                                  tipo='FRMISBUILD')[['AVG','TOTAL']]
+    #Tabla 4 weeks
+    avg_cm_data = [['Last 4 Weeks']]
+    avg_cm_data += [list(avg_cm.columns)]
+    avg_cm_data += avg_cm.values.tolist()
+    num_filas_avg_cm = len(avg_cm_data)
+    row_heights_avg_cm = [ALTO_FILA] * num_filas_avg_cm
+    avg_cm_table = Table(avg_cm_data, colWidths=[60,60], rowHeights=row_heights_avg_cm)
+    avg_cm_table.setStyle(estilos['table_style_weeks'])
+
+    story.append(Spacer(width=0, height=1.5*cm))
+
+    joined_cm = Table([[count_misbuilds_table, avg_cm_table]])
+    story.append(joined_cm)
+    story.append(Spacer(width=0, height=1.5*cm))
+    # 1. Preparar los datos base (igual que antes)
+    prod_data_cm = [
+        ["Production data"],
+        ["", *etiquetas_semanas(df_weekly['Week'])],
+        ["Start Date"] + df_weekly['Start Date'].tolist(),
+        ["End Date"] + df_weekly['End Date'].tolist(),
+        ["ASM Clubs"] + [f"{x:,.0f}" for x in df_weekly['Total ShippedQty']],
+        ["Orders"] + [f"{x:,.0f}" for x in df_weekly['Total Orders']]
+    ]
+
+    # 2. Proporciones sobre ordenes por semana (misbuilds, defectos y errores)
+    ratios_mb = ratios_ordenes(cubo, 'FRMISBUILD', weekly_orders_totals)
+    ratios_defectos = ratios_ordenes(cubo, 'FRDEFECT', weekly_orders_totals)
+    ratios_errores = ratios_ordenes(cubo, 'FRERROR', weekly_orders_totals)
+
+    # 3. Agregar las filas a la tabla (proporcion como decimal, complemento como porcentaje)
+    # (las dos ultimas filas, las de misbuilds, van resaltadas por prod_style)
+    prod_data_cm.append(["Defect of Orders"] + ratios_defectos['ratio'].map('{: .2%}'.format).tolist())
+    prod_data_cm.append(["Error of Orders"] + ratios_errores['ratio'].map('{: .2%}'.format).tolist())
+    prod_data_cm.append(["Misbuild of Orders"] + ratios_mb['ratio'].map('{: .2%}'.format).tolist())
+    prod_data_cm.append(["Build Quality"] + ratios_mb['complemento'].map('{:.2%}'.format).tolist())
+
+    # 4. Crear la tabla con ReportLab
+    prod_cm_table = Table(
+        prod_data_cm,
+        colWidths=[100] + [60] * len(df_weekly),  # Ajusta según necesidad
+    )
+    prod_cm_table.setStyle(estilos['prod_style'])
+    prod_cm_joined = Table([[prod_cm_table, '']])
+    story.append(prod_cm_joined)
+
+    story.append(PageBreak())
+
+    # HISTORICO MISBUILDS
+
+    story.append(Paragraph("Misbuilds and Orders Over Time", custom_title_style))
+    story.append(Spacer(width=0, height=0.3*cm))
+    count_misbuilds8 = tabla_cubo(cubo, 'Description', current_week_num-7, current_week_num, tipo='FRMISBUILD')
+    count_misbuilds8.loc['Total'] = count_misbuilds8.sum(numeric_only=True)
+    count_misbuilds_data8 = datos_tabla(count_misbuilds8, 'Description')
+
+    # 3. Crear tabla de historial
+    num_filas_misbuilds8 = len(count_misbuilds_data8)
+    row_heights_mis8 = [ALTO_FILA] * num_filas_misbuilds8
+    count_misbuilds_table8 = Table(count_misbuilds_data8, colWidths=[150, 58, 58, 58, 58, 58], repeatRows=1, rowHeights=row_heights_mis8)
+    count_misbuilds_table8.setStyle(estilos['table_style_graphic'])
+    # 4. Calcular los datos de resumen (ultimas 4 semanas contra las 4 anteriores)
+    mb_ventana = estadisticas_ventana(cubo, count_misbuilds8.index, 'Description', current_week_num-3, current_week_num,
+                                      tipo='FRMISBUILD')
+
+    # 5. Preparar datos para la tabla de resumen
+    summary_mis8 = pd.DataFrame({'Last 4 Weeks': mb_ventana['TOTAL'], 'Weeks 5-8': mb_ventana['ANTERIOR'],
+                                 'Dif': mb_ventana['DELTA'], 'Total': mb_ventana['TOTAL'] + mb_ventana['ANTERIOR']})
+    summary_data_mis8 = datos_tabla(summary_mis8, columnas=summary_mis8.columns, indice=False)
+
+    # 6. Crear tabla de resumen
+    summary_table_mis8 = Table(summary_data_mis8, colWidths=[58, 58, 58, 58], repeatRows=1, rowHeights=row_heights_mis8)
+    summary_table_mis8.setStyle(estilos['table_style_graphic2'])
+    graphic_joined_mis8 = Table([[count_misbuilds_table8, summary_table_mis8]])
+    story.append(graphic_joined_mis8)
+    marcar_etapa(perfil, 'tablas misbuilds')
+
+    #GRAFICA
+    # Gráfico de líneas
+    misbuilds_counts = ratios_mb['conteo']
+    # 2. Calcular el promedio móvil de 4 semanas
+    misbuilds_4wk_avg = misbuilds_counts.rolling(window=4, min_periods=1).mean()
+    # Misbuilds y promedio movil en el eje izquierdo, ordenes en el derecho
+    series_misbuilds = [
+        {'nombre': 'Total Misbuilds', 'valores': misbuilds_counts.to_numpy(), 'color': 'red', 'marker': 's', 'linestyle': '--'},
+        {'nombre': '4 Week Avg', 'valores': misbuilds_4wk_avg.to_numpy(), 'color': 'green', 'marker': '^', 'linestyle': '-.'},
+    ]
+    series_ordenes_mb = [{'nombre': 'Total Orders', 'valores': df_weekly['Total Orders'].to_numpy(), 'color': 'blue', 'marker': 'o', 'linestyle': '-'}]
+
+    # Insertar la gráfica (vectorial o imagen renderizada en memoria)
+    story.append(Spacer(width=0, height=1*cm))
+    story.append(grafica_lineas(etiquetas_semanas(df_weekly['Week']), series_misbuilds, width=750, height=300,
+                                figsize=(12, 6), eje_derecho=series_ordenes_mb, grid_alpha=0.3,
+                                modo=datos['modo_graficas']))
+    marcar_etapa(perfil, 'grafica misbuilds')
+    return story
+
+
+CONSTRUCTORES_SECCIONES = {
+    'resumen': seccion_resumen,
+    'garantia': seccion_garantia,
+    'produccion': seccion_produccion,
+    'ordenes': seccion_ordenes,
+    'devoluciones': seccion_devoluciones,
+    'semana_actual': seccion_semana_actual,
+    'asm': seccion_asm,
+    'misbuilds': seccion_misbuilds,
+}
+
+
+def paginas_reporte(secciones):
+    # Las secciones del resumen comparten la pagina 'Summary'; las demas van en paginas propias
+    resumen = [seccion for seccion in secciones if seccion in SECCIONES_RESUMEN]
+    return ([resumen] if resumen else []) + [[seccion] for seccion in secciones if seccion not in SECCIONES_RESUMEN]
+
+
+def construir_pagina(datos, secciones):
+    if secciones[0] not in SECCIONES_RESUMEN:
+        return CONSTRUCTORES_SECCIONES[secciones[0]](datos)
+    pagina = [Paragraph("Summary", datos['estilos']['custom_title_style'])]
+    for seccion in secciones:
+        pagina += CONSTRUCTORES_SECCIONES[seccion](datos)
+    return pagina
+
+
+@st.cache_resource
+def pool_secciones(procesos):
+    # Un pool por servidor, creado al primer reporte. 'spawn' y no fork: el servidor ya tiene
+    # hilos (la cola de reportes) que fork copiaria a medio camino
+    return ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn'))
+
+
+def funcion_importable(funcion):
+    # Bajo Streamlit este archivo corre como __main__ y sus funciones no se pueden enviar a
+    # otro proceso; se envia la misma funcion del modulo importado por nombre
+    if funcion.__module__ != '__main__':
+        return funcion
+    modulo = importlib.import_module(os.path.splitext(os.path.basename(__file__))[0])
+    return getattr(modulo, funcion.__name__)
+
+
+def construir_paginas_en_procesos(datos, grupos, calculados, procesos):
+    # Cada pagina se arma en un proceso del pool y se agregan en el orden del PDF, asi el
+    # resultado es el mismo que armandolas una tras otra
+    perfil = datos['perfil']
+    memoria = perfil is not None and perfil['memoria']
+    funcion = funcion_importable(construir_pagina_en_proceso)
+    tareas = [pool_secciones(procesos).submit(funcion, grupo, calculados, datos['semana'], datos['modo_graficas'],
+                                              perfil is not None, memoria)
+              for grupo in grupos]
+    paginas = []
+    for tarea in tareas:
+        pagina, etapas = tarea.result()
+        paginas.append(recibir_envio(pagina))
+        agregar_etapas(perfil, etapas)
+    return paginas
+
+
+def construir_pagina_en_proceso(secciones, calculados, semana, modo_graficas, perfilar, memoria):
+    perfil = iniciar_perfil(memoria) if perfilar else None
+    datos = {'semana': semana, 'modo_graficas': modo_graficas, 'perfil': perfil, 'estilos': estilos_reporte(),
+             'calculados': calculados}
+    pagina = preparar_envio(construir_pagina(datos, secciones))
+    return pagina, terminar_perfil(perfil)['etapas'] if perfil is not None else []
+
+
+def preparar_envio(flowables):
+    # Deja una pagina lista para enviarla entre procesos. Los widgets de las graficas
+    # vectoriales no se pueden serializar: se envian sus argumentos y se vuelven a armar al
+    # recibirlas (ver recibir_envio). Las imagenes ya decodificadas pesan decenas de MB: se
+    # envia el PNG original y ReportLab lo vuelve a leer al dibujarlas
+    enviables = []
+    for flowable in flowables:
+        if isinstance(flowable, Drawing) and hasattr(flowable, '_argumentos'):
+            flowable = ('dibujo_lineas', flowable._argumentos)
+        lector = flowable.__dict__.get('_img') if isinstance(flowable, Image) else None
+        if lector is not None and getattr(lector, 'fp', None) is not None:
+            flowable._file = io.BytesIO(lector.fp.getvalue())
+            del flowable._img
+        enviables.append(flowable)
+    return enviables
+
+
+def recibir_envio(flowables):
+    recibidos = []
+    for flowable in flowables:
+        if isinstance(flowable, tuple):
+            categorias, series, width, height, opciones = flowable[1]
+            flowable = dibujo_lineas(categorias, series, width, height, **opciones)
+        recibidos.append(flowable)
+    return recibidos
+
+
+def generar_reporte(df, df_transposed, semana_seleccionada, modo_graficas=None, perfil=None, secciones=None,
+                    procesos=None, destino=None):
+    # Arma el PDF con las secciones pedidas (todas por defecto). df y df_transposed pueden
+    # venir ya cargados (ver cargar_defectos / cargar_produccion) o como funciones que los
+    # cargan; en ese caso solo se leen si alguna seccion los necesita. La de produccion
+    # recibe la fecha de referencia para el año de sus fechas. Con procesos > 0 las paginas
+    # se arman en paralelo en un pool de procesos (por defecto PROCESOS_SECCIONES). Con
+    # destino (ruta o archivo) el PDF se escribe ahi en vez de en un BytesIO.
+    secciones = secciones_reporte(secciones)
+    current_week_num = numero_semana(semana_seleccionada)
+    datos = {'defectos': df, 'produccion': df_transposed, 'semana': current_week_num,
+             'modo_graficas': modo_graficas, 'perfil': perfil, 'estilos': estilos_reporte(), 'calculados': {}}
+
+    #Crear PDF
+    pdf_buffer = io.BytesIO() if destino is None else destino
+    doc = SimpleDocTemplate(pdf_buffer, **PLANTILLA_DOCUMENTO)
+
+    # Primero las entradas que usan las secciones pedidas, en el orden de las etapas del perfil
+    entradas = [nombre for nombre in ('defectos', 'produccion', 'cubo')
+                if nombre == 'defectos' or any(nombre in DATOS_SECCIONES[seccion] for seccion in secciones)]
+    for nombre in entradas:
+        dato(datos, nombre)
+
+    grupos = paginas_reporte(secciones)
+    procesos = PROCESOS_SECCIONES if procesos is None else procesos
+    if procesos and len(grupos) > 1:
+        # Los procesos reciben solo los datos derivados; el almacen de agregados se toca aqui
+        calculados = {nombre: dato(datos, nombre) for entrada in entradas for nombre in DERIVADOS_PROCESOS[entrada]}
+        paginas = construir_paginas_en_procesos(datos, grupos, calculados, procesos)
+    else:
+        paginas = [construir_pagina(datos, grupo) for grupo in grupos]
+
+    # La portada va sola en la primera pagina
+    story = [PageBreak()]
+    for i, pagina in enumerate(paginas):
+        if i > 0:
+            story.append(PageBreak())
+        story += pagina
+
+    # Guardar (las graficas vectoriales se dibujan aqui)
+    doc.build(story, onFirstPage=functools.partial(draw_cover, etiqueta_semana(current_week_num)))
+    marcar_etapa(perfil, 'layout PDF')
 
     # Obtener los bytes del PDF
-    pdf_buffer.seek(0)
+    if destino is None:
+        pdf_buffer.seek(0)
     return pdf_buffer
 
 
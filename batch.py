@@ -0,0 +1,117 @@
+# Generacion de reportes sin interfaz: parsea los archivos una sola vez y reparte las
+# semanas en un pool de procesos (un reporte por tarea).
+#
+#   python batch.py Defects.xlsx Production.csv --desde 10 --hasta 22 --salida reportes/
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import streamlit.logger
+
+# Antes de importar app, para no mostrar los avisos de cache sin runtime de Streamlit
+streamlit.logger.set_log_level("error")
+
+import app  # noqa: E402
+
+# Datos ya parseados que cada proceso recibe una sola vez al arrancar
+_datos = {}
+
+
+def inicializar_proceso(df, df_transposed, hashes):
+    streamlit.logger.set_log_level("error")
+    _datos['defectos'] = df
+    _datos['produccion'] = df_transposed
+    _datos['hashes'] = hashes
+
+
+def generar_semana(semana, salida, modo_graficas=None, perfil_modo=None, secciones=None):
+    inicio = time.perf_counter()
+    perfil = app.iniciar_perfil(memoria=perfil_modo == 'memoria') if perfil_modo else None
+    # Reutiliza el PDF si ya se genero con los mismos archivos, semana y version
+    # (se copia de la cache o se escribe directo al archivo de salida, sin pasar por memoria)
+    clave = app.clave_pdf(*_datos['hashes'], semana, modo_graficas, secciones)
+    ruta = os.path.join(salida, app.nombre_reporte(semana))
+    if app.copiar_pdf_cache(clave, ruta):
+        app.marcar_etapa(perfil, 'cache PDF')
+    else:
+        app.generar_reporte(_datos['defectos'], _datos['produccion'], semana, modo_graficas, perfil, secciones,
+                            destino=ruta)
+        app.guardar_pdf_cache(clave, ruta)
+    if perfil is not None:
+        # Perfil por etapas junto al PDF, para seguir regresiones entre corridas
+        with open(ruta.replace('.pdf', '.profile.json'), 'w') as f:
+            f.write(app.perfil_json(app.terminar_perfil(perfil)))
+    return ruta, time.perf_counter() - inicio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera reportes de defectos y garantia para un rango de semanas")
+    parser.add_argument('defectos', help="Libro de defectos (Excel)")
+    parser.add_argument('produccion', help="Exportacion de produccion de Tableau (CSV UTF-16)")
+    parser.add_argument('--desde', type=int, help="Primera semana (por defecto la ultima con datos)")
+    parser.add_argument('--hasta', type=int, help="Ultima semana (por defecto la ultima con datos)")
+    parser.add_argument('--salida', default='reportes', help="Directorio de salida")
+    parser.add_argument('--graficas', choices=['vector', 'raster'], help="Graficas vectoriales o PNG (por defecto DWR_CHART_MODE)")
+    parser.add_argument('--secciones', nargs='+', choices=list(app.SECCIONES_REPORTE),
+                        help="Solo estas secciones del reporte (por defecto todas)")
+    parser.add_argument('--perfil', nargs='?', const='tiempo', choices=['tiempo', 'memoria'],
+                        help="Guarda el tiempo (y con 'memoria' el pico de memoria) por etapa en <reporte>.profile.json")
+    parser.add_argument('--procesos', type=int, default=os.cpu_count(), help="Procesos en paralelo")
+    args = parser.parse_args(argv)
+
+    inicio_total = time.perf_counter()
+    salida = os.path.abspath(args.salida)
+
+    # Parseo unico de ambos archivos (reutiliza los snapshots si existen)
+    inicio = time.perf_counter()
+    defectos = app.leer_contenido(args.defectos)
+    produccion = app.leer_contenido(args.produccion)
+    hashes = (app.hash_contenido(defectos), app.hash_contenido(produccion))
+    df = app.obtener_defectos(defectos)
+    # La produccion solo se lee si alguna seccion pedida la usa
+    usa_produccion = any('produccion' in app.DATOS_SECCIONES[seccion] for seccion in app.secciones_reporte(args.secciones))
+    df_transposed = None
+    if usa_produccion:
+        # Completa: el almacen semanal conserva todas las semanas y cada reporte toma las suyas
+        df_transposed = app.obtener_produccion(produccion, referencia=df['Date:'].max())
+    # Deja el almacen de agregados al dia antes de repartir, asi los procesos solo lo leen
+    app.conteos_semanales(df)
+    if usa_produccion:
+        app.produccion_semanal(df_transposed)
+    print(f"Carga de datos: {time.perf_counter() - inicio:.2f}s")
+
+    semanas_disponibles = sorted(df['semana_relativa'].unique().tolist())
+    if not semanas_disponibles:
+        print("No valid weeks were found in the file.", file=sys.stderr)
+        return 1
+    hasta = args.hasta if args.hasta is not None else semanas_disponibles[-1]
+    desde = args.desde if args.desde is not None else hasta
+    semanas = [semana for semana in semanas_disponibles if desde <= semana <= hasta]
+    if not semanas:
+        print(f"No weeks with data between {desde} and {hasta}.", file=sys.stderr)
+        return 1
+
+    os.makedirs(salida, exist_ok=True)
+    errores = 0
+    with ProcessPoolExecutor(max_workers=min(args.procesos or 1, len(semanas)),
+                             initializer=inicializar_proceso,
+                             initargs=(df, df_transposed, hashes)) as pool:
+        tareas = {pool.submit(generar_semana, semana, salida, args.graficas, args.perfil, args.secciones): semana
+                  for semana in semanas}
+        for tarea in as_completed(tareas):
+            semana = tareas[tarea]
+            try:
+                ruta, segundos = tarea.result()
+                print(f"{app.etiqueta_semana(semana)}: {segundos:.2f}s -> {ruta}")
+            except Exception as e:
+                errores += 1
+                print(f"{app.etiqueta_semana(semana)}: Error generating the report: {e}", file=sys.stderr)
+
+    print(f"{len(semanas) - errores} reports in {time.perf_counter() - inicio_total:.2f}s")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# Compara el parser de fechas por columna con el fallback por fila anterior
+# sobre una exportacion diaria de Tableau de varios años (encabezados sin año, que se
+# repiten una vez por año), leida por el mismo camino que el reporte.
+#
+#   python benchmarks/bench_fechas.py --anios 3 --repeticiones 5
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import columnas_fecha_produccion, parsear_fechas, parsear_produccion  # noqa: E402
+from generadores import fechas_rango, generar_produccion  # noqa: E402
+
+
+def convert_date(date_str):
+    # Version anterior: hasta cuatro to_datetime por celda y año fijo 2025
+    try:
+        return pd.to_datetime(date_str + '-2025', format='%b %d-%Y')
+    except ValueError:
+        try:
+            return pd.to_datetime(date_str + '-2025', format='%b-%d-%Y')
+        except:
+            try:
+                return pd.to_datetime(date_str, format='ISO8601')
+            except:
+                return pd.to_datetime(date_str, format='mixed', dayfirst=False)
+
+
+def convert_date_o_nat(date_str):
+    # La version anterior no sabe leer "Feb 29" en años no bisiestos
+    try:
+        return convert_date(date_str)
+    except ValueError:
+        return pd.NaT
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del parser de fechas de produccion")
+    parser.add_argument('--anios', type=int, default=3)
+    parser.add_argument('--repeticiones', type=int, default=5)
+    args = parser.parse_args()
+
+    semanas = 52 * args.anios
+    fechas = fechas_rango(semanas)
+    contenido = generar_produccion(semanas)
+    referencia = fechas[-1]
+    # Texto original de los encabezados (pandas renombra los repetidos)
+    columnas = pd.Series(columnas_fecha_produccion(contenido).to_numpy())
+
+    t_fila, anterior = medir(lambda: columnas.apply(convert_date_o_nat), args.repeticiones)
+    t_columna, nuevo = medir(lambda: parsear_fechas(columnas, referencia), args.repeticiones)
+    # De punta a punta: las fechas que quedan en la produccion parseada
+    produccion = parsear_produccion(contenido, referencia)
+
+    print(f"columnas de fecha: {len(columnas)} ({columnas.duplicated().sum()} encabezados repetidos)")
+    print(f"por fila (convert_date): {t_fila * 1000:9.1f} ms, fechas correctas: {(anterior.values == fechas.values).sum()}")
+    print(f"por columna (parsear_fechas): {t_columna * 1000:9.1f} ms, fechas correctas: {(nuevo.values == fechas.values).sum()}")
+    print(f"parsear_produccion: fechas correctas {(produccion['Fecha'].values == fechas.values).sum()}, "
+          f"semanas nulas {produccion['semana_relativa'].isna().sum()}")
+    print(f"aceleracion: {t_fila / t_columna:.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# Mide procesar_archivos por etapa sobre entradas sinteticas de distinto tamaño: una
+# corrida en frio (sin snapshots ni cache en memoria) y otra en caliente por escenario.
+# Los resultados se pueden guardar como linea base y comparar contra corridas futuras.
+#
+#   python benchmarks/bench_reporte.py --filas 5000 50000 --semanas 52 156 --guardar benchmarks/linea_base.json
+#   python benchmarks/bench_reporte.py --filas 5000 50000 --semanas 52 156 --comparar benchmarks/linea_base.json
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import streamlit.logger
+
+# Antes de importar app, para no mostrar los avisos de cache sin runtime de Streamlit
+streamlit.logger.set_log_level("error")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from generadores import SITIOS_PRODUCCION, generar_defectos, generar_produccion  # noqa: E402
+
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.datos')
+
+
+def entrada(nombre, generar):
+    # Generar libros grandes tarda mas que procesarlos; se guardan para las siguientes corridas
+    ruta = os.path.join(DIRECTORIO_DATOS, nombre)
+    if os.path.exists(ruta):
+        with open(ruta, 'rb') as f:
+            return f.read()
+    contenido = generar()
+    os.makedirs(DIRECTORIO_DATOS, exist_ok=True)
+    with open(ruta, 'wb') as f:
+        f.write(contenido)
+    return contenido
+
+
+def correr(defectos, produccion, semana, modo_graficas, memoria, secciones=None):
+    perfil = app.iniciar_perfil(memoria)
+    app.procesar_archivos(defectos, produccion, semana, modo_graficas, perfil, secciones)
+    return app.terminar_perfil(perfil)
+
+
+def escenario(filas, semanas, sitios, modo_graficas, memoria, secciones=None):
+    inicio = time.perf_counter()
+    defectos = entrada(f"defectos_{filas}_{semanas}.xlsx", lambda: generar_defectos(filas, semanas))
+    produccion = entrada(f"produccion_{semanas}_{sitios}.csv", lambda: generar_produccion(semanas, sitios))
+    print(f"  entradas listas en {time.perf_counter() - inicio:.1f}s "
+          f"({len(defectos) / 2**20:.1f} MB defectos, {len(produccion) / 2**20:.1f} MB produccion)")
+
+    with tempfile.TemporaryDirectory() as cache:
+        # En frio: directorio de cache vacio y caches de Streamlit limpias
+        app.CACHE_DIR = cache
+        app.cargar_defectos.clear()
+        app.cargar_produccion.clear()
+        frio = correr(defectos, produccion, semanas, modo_graficas, memoria, secciones)
+        # En caliente: snapshots y agregados ya guardados, pero sin el PDF terminado
+        shutil.rmtree(os.path.join(cache, 'pdfs'), ignore_errors=True)
+        caliente = correr(defectos, produccion, semanas, modo_graficas, memoria, secciones)
+    return {'filas': filas, 'semanas': semanas, 'sitios': sitios, 'graficas': modo_graficas or app.MODO_GRAFICAS,
+            'frio': frio, 'caliente': caliente}
+
+
+def imprimir(resultado, base=None):
+    print(f"  {'etapa':<24}{'frio s':>10}{'caliente s':>12}" + (f"{'base s':>10}{'x base':>9}" if base else ''))
+    caliente = {etapa['etapa']: etapa for etapa in resultado['caliente']['etapas']}
+    anteriores = {etapa['etapa']: etapa for etapa in base['frio']['etapas']} if base else {}
+    filas = resultado['frio']['etapas'] + [{'etapa': 'total', 'segundos': resultado['frio']['total_segundos']}]
+    caliente['total'] = {'segundos': resultado['caliente']['total_segundos']}
+    if base:
+        anteriores['total'] = {'segundos': base['frio']['total_segundos']}
+    for etapa in filas:
+        linea = f"  {etapa['etapa']:<24}{etapa['segundos']:>10.3f}{caliente.get(etapa['etapa'], {}).get('segundos', 0):>12.3f}"
+        if 'pico_mb' in etapa:
+            linea += f"  {etapa['pico_mb']:>7.1f} MB"
+        anterior = anteriores.get(etapa['etapa'])
+        if anterior:
+            linea += f"{anterior['segundos']:>10.3f}{etapa['segundos'] / max(anterior['segundos'], 1e-6):>8.2f}x"
+        print(linea)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del reporte sobre datos sinteticos")
+    parser.add_argument('--filas', type=int, nargs='+', default=[5000, 50000], help="Reclamos en el libro de defectos")
+    parser.add_argument('--semanas', type=int, nargs='+', default=[52], help="Semanas cubiertas por ambos archivos")
+    parser.add_argument('--sitios', type=int, default=SITIOS_PRODUCCION, help="Sitios en la exportacion de produccion")
+    parser.add_argument('--graficas', choices=['vector', 'raster'])
+    parser.add_argument('--secciones', nargs='+', choices=list(app.SECCIONES_REPORTE), help="Solo estas secciones")
+    parser.add_argument('--procesos-secciones', type=int, default=0, help="Arma las paginas en N procesos (0: en serie)")
+    parser.add_argument('--memoria', action='store_true', help="Mide tambien el pico de memoria (mas lento)")
+    parser.add_argument('--guardar', help="Guarda los resultados como linea base (JSON)")
+    parser.add_argument('--comparar', help="Linea base (JSON) contra la que comparar")
+    args = parser.parse_args()
+    app.PROCESOS_SECCIONES = args.procesos_secciones
+
+    base = {}
+    if args.comparar:
+        with open(args.comparar) as f:
+            base = {(r['filas'], r['semanas'], r['sitios'], r['graficas']): r for r in json.load(f)['resultados']}
+
+    resultados = []
+    for semanas in args.semanas:
+        for filas in args.filas:
+            print(f"{filas} reclamos, {semanas} semanas, {args.sitios} sitios")
+            resultado = escenario(filas, semanas, args.sitios, args.graficas, args.memoria, args.secciones)
+            imprimir(resultado, base.get((filas, semanas, args.sitios, resultado['graficas'])))
+            resultados.append(resultado)
+
+    if args.guardar:
+        with open(args.guardar, 'w') as f:
+            json.dump({'resultados': resultados}, f, indent=2)
+        print(f"Linea base guardada en {args.guardar}")
+
+
+if __name__ == '__main__':
+    main()
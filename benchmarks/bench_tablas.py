@@ -0,0 +1,91 @@
+# Compara TablaDetalle con la Table de ReportLab en una tabla de misbuilds de varias
+# paginas (sin repetir el encabezado): los bloques de cada pagina deben tener las mismas
+# filas y el mismo formato de celdas y fondos, y se mide el tiempo de armar el PDF.
+#
+#   python benchmarks/bench_tablas.py --filas 200 1000 4000 --alto 300
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+from generadores import DESCRIPCIONES  # noqa: E402
+from reportlab.platypus import SimpleDocTemplate, Table  # noqa: E402
+
+ENCABEZADOS = ['Date', 'Shipper:', 'Original Order', 'RMA', 'Description', 'Type', 'Pod', 'Warehouse',
+               'Build Date', 'Days']
+
+
+def filas_misbuilds(filas, semilla=0):
+    # Filas con las columnas de la tabla de misbuilds, ya como texto
+    rng = np.random.default_rng(semilla)
+    return [[f"04/{dia:02d}/2025", shipper, str(orden), str(rma), descripcion, 'FRMISBUILD', pod, bodega,
+             f"2025-03-{dia:02d} 00:00:00", str(dias)]
+            for dia, shipper, orden, rma, descripcion, pod, bodega, dias in zip(
+                rng.integers(1, 29, filas), rng.choice(['UPS', 'FedEx', 'USPS'], filas),
+                rng.integers(100000, 999999, filas), rng.integers(1000, 9999, filas),
+                rng.choice(DESCRIPCIONES, filas), rng.choice(['1.0', '2.0', 'nan'], filas),
+                rng.choice(['CA', 'TX'], filas), rng.integers(1, 90, filas))]
+
+
+def bloques(tabla, alto):
+    # Parte la tabla como lo haria un frame de ese alto, una pagina por bloque
+    partes = []
+    while True:
+        tabla.wrap(750, alto)
+        division = tabla.split(750, alto)
+        if len(division) < 2:
+            partes.append(division[0] if division else tabla)
+            return partes
+        partes.append(division[0])
+        tabla = division[1]
+
+
+def formato(tabla):
+    # Filas, formato de cada celda y fondos de un bloque ya armado como Table
+    celdas = [[(s.fontname, s.fontsize, s.alignment, s.valign) for s in fila] for fila in tabla._cellStyles]
+    fondos = sorted(str(comando) for comando in tabla._bkgrndcmds)
+    return tabla._cellvalues, celdas, fondos
+
+
+def construir(flowable):
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, **app.PLANTILLA_DOCUMENTO)
+    inicio = time.perf_counter()
+    doc.build([flowable])
+    return time.perf_counter() - inicio, doc.page
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las tablas de detalle partidas entre paginas")
+    parser.add_argument('--filas', type=int, nargs='+', default=[200, 1000, 4000])
+    parser.add_argument('--alto', type=float, default=300, help="Alto disponible por pagina al comparar bloques")
+    args = parser.parse_args()
+    estilo = app.estilos_reporte()['table_style_semana_actual']
+
+    for filas in args.filas:
+        datos = filas_misbuilds(filas)
+        anterior = Table([ENCABEZADOS] + datos)
+        anterior.setStyle(estilo)
+        nuevo = app.TablaDetalle(ENCABEZADOS, datos, estilo, repetir_encabezado=False)
+        partes_anterior = bloques(anterior, args.alto)
+        partes_nuevo = bloques(nuevo, args.alto)
+        iguales = sum(formato(a) == formato(b.tabla()) for a, b in zip(partes_anterior, partes_nuevo))
+
+        tabla = Table([ENCABEZADOS] + datos)
+        tabla.setStyle(estilo)
+        t_anterior, paginas_anterior = construir(tabla)
+        t_nuevo, paginas_nuevo = construir(app.TablaDetalle(ENCABEZADOS, datos, estilo, repetir_encabezado=False))
+
+        print(f"{filas} filas: bloques de {args.alto:.0f}pt {len(partes_nuevo)} (Table {len(partes_anterior)}), "
+              f"con filas y formato iguales {iguales}")
+        print(f"  PDF: Table {t_anterior:.2f}s / {paginas_anterior} paginas, "
+              f"TablaDetalle {t_nuevo:.2f}s / {paginas_nuevo} paginas")
+
+
+if __name__ == '__main__':
+    main()
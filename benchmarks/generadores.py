@@ -0,0 +1,70 @@
+# Generadores de entradas sinteticas con la forma de los archivos reales: el libro de
+# defectos (Excel, encabezados en la fila 2) y la exportacion de produccion de Tableau
+# (CSV UTF-16 separado por tabs, una columna por dia y filas por sitio / turno / metrica).
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import CATALOGO_DEFECTOS, FECHA_INICIO  # noqa: E402
+
+# Descripciones reales y una fuera del catalogo (queda sin Type, como en los libros reales)
+DESCRIPCIONES = list(CATALOGO_DEFECTOS) + ['Unknown reason']
+STAGED = ['Warranty', 'Warranty', 'Warranty', 'Return', 'Repair']
+SITIOS_PRODUCCION = 2
+
+
+def fechas_rango(semanas):
+    # Dias desde el inicio de la semana 1 cubriendo el numero de semanas pedido
+    return pd.date_range(FECHA_INICIO, periods=semanas * 7, freq='D')
+
+
+def generar_defectos(filas, semanas, semilla=0):
+    # Libro de defectos con las columnas reales, ordenado por fecha de reclamo
+    rng = np.random.default_rng(semilla)
+    fechas = np.sort(rng.choice(fechas_rango(semanas).to_numpy(), filas))
+    df = pd.DataFrame({
+        "Date:": fechas,
+        "Shipper:": rng.choice(['UPS', 'FedEx', 'USPS'], filas),
+        "Original Order or Serial #": rng.integers(100000, 999999, filas),
+        "RMA": rng.integers(1000, 9999, filas),
+        "RC": rng.choice(['A', 'B'], filas),
+        "Status? (0,1,2)": rng.integers(0, 3, filas),
+        "Shipping Carrier": rng.choice(['UPS', 'FedEx'], filas),
+        "Tracking Number": rng.integers(10**9, 10**10, filas),
+        "Staged": rng.choice(STAGED, filas),
+        "Make / Model": rng.choice(['Driver', 'Fairway', 'Iron Set', 'Wedge', 'Putter'], filas),
+        "Claim Type (Description)": rng.choice(DESCRIPCIONES, filas),
+        "Pod Number": rng.choice([1, 2, 3, 4, np.nan], filas),
+        "Original Build Shop": rng.choice(['CA', 'TX'], filas),
+        "Original Sales Order Date": fechas - rng.integers(5, 90, filas).astype('timedelta64[D]'),
+        "Days": rng.integers(1, 90, filas),
+    })
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        pd.DataFrame([["Warranty claims log"]]).to_excel(writer, header=False, index=False)
+        df.to_excel(writer, startrow=1, index=False)
+    return buffer.getvalue()
+
+
+def generar_produccion(semanas, sitios=SITIOS_PRODUCCION, turnos=2, semilla=0):
+    # Exportacion de Tableau: por cada sitio y turno las metricas Orders, ShippedQty y
+    # Shipments, mas el bloque 'Grand Total'. Las fechas van sin año, como las exporta
+    # Tableau: con mas de un año los encabezados se repiten ("Jul 1" aparece una vez por año)
+    rng = np.random.default_rng(semilla)
+    dias = fechas_rango(semanas)
+    columnas = [dia.strftime('%b %-d') for dia in dias]
+    claves = [(f"Site {sitio + 1}", f"Shift {turno + 1}") for sitio in range(sitios) for turno in range(turnos)]
+    claves.append(('Grand Total', ''))
+    filas = []
+    for sitio, turno in claves:
+        for metrica in ['Orders', 'ShippedQty', 'Shipments']:
+            valores = rng.integers(50, 3000, len(columnas))
+            texto = [f"{v:,}" for v in valores] if metrica == 'ShippedQty' else valores.astype(str).tolist()
+            filas.append([sitio, turno, metrica, *texto, str(valores.sum())])
+    tabla = pd.DataFrame(filas, columns=['SiteName', 'Local Operations Shift', '', *columnas, 'Grand Total'])
+    texto = "Production by date\n" + tabla.to_csv(sep='\t', index=False)
+    return texto.encode('utf-16')